@@ -0,0 +1,73 @@
+"""
+Import-time benchmark for the bot's startup path.
+
+Imports each module in a fresh interpreter with `python -X importtime` and
+reports the cumulative import time, so regressions in cold-start cost (e.g. a
+provider SDK imported at module level again) show up quickly.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--max-ms 500]
+
+With --max-ms the script exits with status 1 if any module is slower.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules on the startup path. main.py is left out because importing it starts the scheduler.
+MODULES = [
+    "config",
+    "services.llm_service",
+    "services.x_service",
+    "services.automation_service",
+    "utils.calendar_utils",
+]
+
+
+def measure(module: str) -> float:
+    """Returns the cumulative import time of `module` in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip().splitlines()[-1]}")
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    for line in reversed(result.stderr.splitlines()):
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if a module's median exceeds this")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<32} {'median ms':>10} {'min ms':>8}")
+    for module in MODULES:
+        try:
+            timings = [measure(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<32} ERROR: {e}")
+            failed = True
+            continue
+
+        median = statistics.median(timings)
+        print(f"{module:<32} {median:>10.1f} {min(timings):>8.1f}")
+        if args.max_ms is not None and median > args.max_ms:
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,3 +12,79 @@ TWITTER_ACCESS_TOKEN_SECRET = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
 TWITTER_BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN")
 ALLOWED_TELEGRAM_USER_ID = os.getenv("ALLOWED_TELEGRAM_USER_ID")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+
+# Update processing: different chats run in parallel, a single chat stays in order
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "8"))
+UPDATE_MAX_PENDING_PER_CHAT = int(os.getenv("UPDATE_MAX_PENDING_PER_CHAT", "20"))
+UPDATE_MAX_QUEUED = int(os.getenv("UPDATE_MAX_QUEUED", "256"))
+
+# Per-user rate limits as 'capacity/seconds' token buckets
+RATE_LIMIT_GENERATE = os.getenv("RATE_LIMIT_GENERATE", "30/3600")
+RATE_LIMIT_REGENERATE = os.getenv("RATE_LIMIT_REGENERATE", "15/3600")
+RATE_LIMIT_POST = os.getenv("RATE_LIMIT_POST", "10/86400")
+
+# Idle conversations are dropped after this many seconds; at most SESSION_MAX_USERS are kept
+SESSION_IDLE_TIMEOUT = int(os.getenv("SESSION_IDLE_TIMEOUT", "3600"))
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", "500"))
+
+# Content-addressed photo storage; unused files are garbage collected after MEDIA_TTL seconds
+MEDIA_DIR = os.getenv("MEDIA_DIR", "media_cache")
+MEDIA_TTL = int(os.getenv("MEDIA_TTL", "86400"))
+
+# Photos are downscaled and re-encoded before upload (needs Pillow)
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "true").lower() in ("1", "true", "yes")
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "2048"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "4"))
+
+# Provider connections are opened at startup and re-warmed after this many idle seconds
+LLM_WARMUP = os.getenv("LLM_WARMUP", "true").lower() in ("1", "true", "yes")
+LLM_KEEPALIVE_IDLE = int(os.getenv("LLM_KEEPALIVE_IDLE", "240"))
+
+# Posting runs in separate worker processes (worker.py) fed by a SQLite job queue
+WORK_QUEUE_DB = os.getenv("WORK_QUEUE_DB", "work_queue.db")
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+WORKER_LEASE_SECONDS = int(os.getenv("WORKER_LEASE_SECONDS", "300"))
+WORKER_RELAY_INTERVAL = float(os.getenv("WORKER_RELAY_INTERVAL", "3.0"))
+
+# Away Mode config, daily count and theme selector state, shared by the bot and the workers
+AUTOMATION_DB = os.getenv("AUTOMATION_DB", "automation.db")
+
+# Pre-written drafts imported with /import, posted by Away Mode
+DRAFTS_DB = os.getenv("DRAFTS_DB", "drafts.db")
+
+# Engagement metrics of posted tweets, refreshed in batches of up to 100 IDs per request
+METRICS_DB = os.getenv("METRICS_DB", "metrics.db")
+METRICS_INTERVAL_MINUTES = int(os.getenv("METRICS_INTERVAL_MINUTES", "60"))
+METRICS_MAX_REQUESTS_PER_RUN = int(os.getenv("METRICS_MAX_REQUESTS_PER_RUN", "1"))
+METRICS_REFRESH_INTERVAL = int(os.getenv("METRICS_REFRESH_INTERVAL", "21600"))
+METRICS_MAX_AGE_DAYS = float(os.getenv("METRICS_MAX_AGE_DAYS", "14"))
+
+# Away Mode theme/style/tone selection (discounted Thompson sampling on engagement)
+BANDIT_DECAY = float(os.getenv("BANDIT_DECAY", "0.98"))
+BANDIT_REWARD_SCALE = float(os.getenv("BANDIT_REWARD_SCALE", "10"))
+BANDIT_REWARD_MIN_AGE_HOURS = float(os.getenv("BANDIT_REWARD_MIN_AGE_HOURS", "24"))
+
+# Tones, styles and themes for generation; edits to this file are picked up without a restart
+PROMPTS_FILE = os.getenv("PROMPTS_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts.json"))
+
+# Logging goes through a background queue; LOG_FORMAT=json writes one JSON object per line.
+# LOG_DEBUG_SAMPLING keeps a share of DEBUG lines per module, e.g. "services.work_queue=0.1"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_FILE = os.getenv("LOG_FILE")
+LOG_DEBUG_SAMPLING = os.getenv("LOG_DEBUG_SAMPLING", "")
+
+# Per-update tracing, written to TRACE_FILE (json spans or otlp); off when unset.
+# TRACE_PROFILE_SLOWEST=N keeps sampled stacks of the N slowest traces in TRACE_PROFILE_DIR
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_FORMAT = os.getenv("TRACE_FORMAT", "json")
+TRACE_PROFILE_SLOWEST = int(os.getenv("TRACE_PROFILE_SLOWEST", "0"))
+TRACE_PROFILE_INTERVAL = float(os.getenv("TRACE_PROFILE_INTERVAL", "0.005"))
+TRACE_PROFILE_DIR = os.getenv("TRACE_PROFILE_DIR", "profiles")
+
+# Thread mode: tweets requested per thread, how many failed tweets may be rewritten
+# (a thread costs 1 + THREAD_MAX_REWRITES generate tokens) and how many at once
+THREAD_LENGTH = int(os.getenv("THREAD_LENGTH", "5"))
+THREAD_MAX_REWRITES = int(os.getenv("THREAD_MAX_REWRITES", "2"))
+THREAD_REPAIR_WORKERS = int(os.getenv("THREAD_REPAIR_WORKERS", "4"))
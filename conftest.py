@@ -0,0 +1,4 @@
+# Makes the top-level packages (services, utils, config) importable from tests/
+
+# A manual X credentials check that exits at import, not a test module
+collect_ignore = ["test_keys.py"]
@@ -1,41 +1,86 @@
-import logging
-import os
+import asyncio
+import datetime
+import functools
 import logging
 import os
 import sys
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, ConversationHandler, CallbackQueryHandler
+from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters, ConversationHandler, CallbackQueryHandler, TypeHandler
 import config
-from services.llm_service import LLMService
-from services.x_service import XService
+from services.llm_service import LLMService, MAX_TWEET_LENGTH, MAX_THREAD_SEGMENTS, number_prefix, segment_problem, split_thread
 from services.automation_service import AutomationService
+from services.media_store import MediaStore
+from services.work_queue import WorkQueue, LEASE_EXPIRED_ERROR
+from services.draft_store import DraftStore
+from services.prompt_registry import get_registry
+from services.metrics_store import MetricsStore
 from apscheduler.schedulers.background import BackgroundScheduler
 import re
-from utils.calendar_utils import create_calendar, process_calendar_selection, CALENDAR_CALLBACK
+import tempfile
+from utils.calendar_utils import create_calendar, process_calendar_selection, CALENDAR_CALLBACK, CONFIRM_CALLBACK
+from utils.update_processor import ChatOrderedUpdateProcessor, TracedHTTPXRequest
+from utils import tracing
+from utils.rate_limiter import RateLimiter, parse_limit
+from utils.session_tracker import SessionTracker
+from utils.draft_import import import_drafts
+from utils.logging_utils import setup_logging
 
 # Define states for ConversationHandler
 TOPIC, TONE, REVIEW = range(3)
 # Define states for Automation Handler
 AUTO_DATES, AUTO_COUNT, AUTO_THEMES = range(3, 6)
+# Define state for bulk draft import
+IMPORT_FILE = 6
+# Telegram bots can't download files larger than 20 MB
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
 # Callback data prefix for themes
 THEME_PREFIX = "THEME_"
 DONE_ACTION = "DONE_THEMES"
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
+AB_TEST_ACTION = "AB_TEST"
+# Thread mode: the THREAD button switches the keyboard to THREAD_<tone> buttons
+THREAD_ACTION = "THREAD"
+THREAD_PREFIX = "THREAD_"
+
+# Log calls only enqueue records, a listener thread formats and writes them
+setup_logging(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_FILE, config.LOG_DEBUG_SAMPLING)
+logger = logging.getLogger(__name__)
+tracing.configure_from_config()
+
+# Loaded (and validated) at startup, so a broken prompt file fails fast
+prompt_registry = get_registry()
 llm_service = LLMService()
-x_service = XService()
-automation_service = AutomationService()
+media_store = MediaStore()
+# Posting happens in worker.py, the bot only enqueues jobs and relays their results
+work_queue = WorkQueue()
+draft_store = DraftStore()
+metrics_store = MetricsStore()
+automation_service = AutomationService(llm_service=llm_service, draft_store=draft_store)
+rate_limiter = RateLimiter({
+    'generate': parse_limit(config.RATE_LIMIT_GENERATE),
+    'regenerate': parse_limit(config.RATE_LIMIT_REGENERATE),
+    'post': parse_limit(config.RATE_LIMIT_POST),
+})
+session_tracker = SessionTracker(config.SESSION_IDLE_TIMEOUT, config.SESSION_MAX_USERS)
+# Set from ALLOWED_TELEGRAM_USER_ID at startup; None lets everyone in
+allowed_user_id = None
 
 # Scheduler Setup
 scheduler = BackgroundScheduler()
-# Run check_and_post every 30 minutes
-scheduler.add_job(automation_service.check_and_post, 'interval', minutes=30)
+# Have a worker run check_and_post every 30 minutes
+scheduler.add_job(work_queue.enqueue, 'interval', minutes=30, args=['automation_tick', {}], kwargs={'unique': True, 'at_most_once': True})
+# Refresh engagement metrics of recent tweets
+scheduler.add_job(work_queue.enqueue, 'interval', minutes=config.METRICS_INTERVAL_MINUTES, args=['collect_metrics', {}], kwargs={'unique': True})
+# Forget old finished jobs
+scheduler.add_job(work_queue.purge, 'interval', hours=6)
+# Delete photos nobody has used for a while
+scheduler.add_job(media_store.gc, 'interval', minutes=30)
+if config.LLM_WARMUP:
+    # Open provider connections now instead of on the first user request
+    llm_service.start_warm_up()
+    scheduler.add_job(llm_service.keep_alive, 'interval', seconds=max(config.LLM_KEEPALIVE_IDLE // 2, 30))
 scheduler.start()
 
+@tracing.traced()
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.send_message(chat_id=update.effective_chat.id, text="Hi! Send me a topic or thought, and I'll generate a tweet for you.")
     return TOPIC
@@ -47,14 +92,108 @@ async def check_terminate(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             chat_id=update.effective_chat.id, 
             text="🛑 Operation terminated. Reseting to start... Send me a new topic."
         )
-        # Clear context
-        keys_to_clear = ['topic', 'tone', 'mode', 'tweet', 'tweet_a', 'tweet_b', 'media_paths', 'auto_start', 'auto_end', 'auto_count', 'selected_themes', 'cal_step']
-        for key in keys_to_clear:
-            context.user_data.pop(key, None)
-            
+        clear_session(context.user_data)
         return True
     return False
 
+def cleanup_media(media_paths):
+    """Releases attached photos; the media store deletes them once unused."""
+    media_store.release(media_paths)
+
+def clear_session(user_data):
+    """Drops all conversation data of a user, including attached media."""
+    cleanup_media(user_data.get('media_paths'))
+    keys_to_clear = ['topic', 'tone', 'mode', 'tweet', 'tweet_a', 'tweet_b', 'media_paths', 'auto_start', 'auto_end', 'auto_count', 'available_themes', 'selected_themes', 'cal_step', 'ab_tones', 'thread']
+    for key in keys_to_clear:
+        user_data.pop(key, None)
+
+def evict_users(application, user_ids):
+    for user_id in user_ids:
+        user_data = application.user_data.get(user_id)
+        if user_data is not None:
+            clear_session(user_data)
+            application.drop_user_data(user_id)
+    if user_ids:
+        logger.info("Evicted %s idle sessions. Active sessions: %s", len(user_ids), len(session_tracker))
+
+async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs before every handler to keep the LRU of active sessions up to date."""
+    user = update.effective_user
+    # Only users the handlers accept get a session, others must not push them out of the LRU
+    if user and (allowed_user_id is None or user.id == allowed_user_id):
+        evict_users(context.application, session_tracker.touch(user.id))
+
+async def sweep_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic job dropping sessions that have been idle for too long."""
+    evict_users(context.application, session_tracker.expired())
+
+@tracing.traced()
+async def conversation_timeout(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Called by the ConversationHandlers when a conversation has been idle for too long."""
+    clear_session(context.user_data)
+
+async def session_expired(update: Update, context: ContextTypes.DEFAULT_TYPE, *keys, restart: str = "Send me a new topic") -> bool:
+    """
+    Checks that the conversation's data is still there. Evicting a session drops
+    user_data but not the ConversationHandler state, so a handler can run
+    without it; the user is told to start over instead.
+    """
+    if all(key in context.user_data for key in keys):
+        return False
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=f"⌛ This session has expired. {restart} to start again.")
+    return True
+
+async def check_rate_limit(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, cost: int = 1) -> bool:
+    """Consumes the user's quota for an action. Tells the user and returns False if exhausted."""
+    retry_after = rate_limiter.check(update.effective_user.id, action, cost)
+    if retry_after:
+        wait = "a while" if retry_after == float("inf") else f"{int(retry_after) + 1}s"
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"⏳ Rate limit reached for '{action}'. Please try again in {wait}."
+        )
+        return False
+    return True
+
+def generation_cost(mode: str) -> int:
+    """Rate limit tokens per generation: A/B makes two, a thread may rewrite some of its tweets."""
+    if mode == 'ab':
+        return 2
+    if mode == 'thread':
+        return 1 + config.THREAD_MAX_REWRITES
+    return 1
+
+@functools.lru_cache(maxsize=8)
+def tone_keyboard(prompts, thread: bool = False) -> InlineKeyboardMarkup:
+    """Tone buttons for one version of the prompt file, built once per version."""
+    prefix = THREAD_PREFIX if thread else ""
+    buttons = [InlineKeyboardButton(label, callback_data=f"{prefix}{name}") for name, label in prompts.tone_labels.items()]
+    keyboard = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    if not thread:
+        keyboard.append([InlineKeyboardButton("🆚 A/B Options (Dual Tone)", callback_data=AB_TEST_ACTION)])
+        keyboard.append([InlineKeyboardButton("🧵 Thread", callback_data=THREAD_ACTION)])
+    return InlineKeyboardMarkup(keyboard)
+
+def format_thread(segments: list[str]) -> str:
+    return "\n\n".join(segments)
+
+def parse_thread(text: str):
+    """
+    Turns a thread typed by the user into numbered tweets.
+    Returns (segments, None) or (None, reason).
+    """
+    segments = split_thread(text)
+    if not 2 <= len(segments) <= MAX_THREAD_SEGMENTS:
+        return None, f"a thread needs 2-{MAX_THREAD_SEGMENTS} tweets, separated by blank lines or numbered like 1/ and 2/"
+    count = len(segments)
+    limit = MAX_TWEET_LENGTH - len(number_prefix(count, count))
+    for i, segment in enumerate(segments):
+        problem = segment_problem(segment, limit)
+        if problem:
+            return None, f"tweet {i + 1}: {problem}"
+    return [number_prefix(i + 1, count) + segment for i, segment in enumerate(segments)], None
+
+@tracing.traced()
 async def handle_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Check terminate
     if await check_terminate(update, context):
@@ -63,19 +202,15 @@ async def handle_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_topic = update.message.text
     context.user_data['topic'] = user_topic # Save topic
     # Reset media on new topic
+    cleanup_media(context.user_data.get('media_paths'))
     context.user_data['media_paths'] = []
     
-    keyboard = [
-        [InlineKeyboardButton("Human 🙋‍♂️", callback_data='Human'), InlineKeyboardButton("Professional 💼", callback_data='Professional')],
-        [InlineKeyboardButton("Funny 😂", callback_data='Funny'), InlineKeyboardButton("Logical 🧠", callback_data='Logical')],
-        [InlineKeyboardButton("Technical 💻", callback_data='Technical'), InlineKeyboardButton("Mathematical 🔢", callback_data='Mathematical')],
-        [InlineKeyboardButton("🆚 A/B Options (Dual Tone)", callback_data='AB_TEST')],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = tone_keyboard(prompt_registry.current())
     
     await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Topic: {user_topic}\n\nChoose a tone:", reply_markup=reply_markup)
     return TONE
 
+@tracing.traced()
 async def handle_tone_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles text input during TONE state (mainly for terminate)."""
     if await check_terminate(update, context):
@@ -84,22 +219,37 @@ async def handle_tone_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.send_message(chat_id=update.effective_chat.id, text="Please select a tone from the buttons above, or type 'terminate' to restart.")
     return TONE
 
+@tracing.traced()
 async def handle_tone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
+    if await session_expired(update, context, 'topic'):
+        return TOPIC
+
     data = query.data
     user_topic = context.user_data.get('topic')
+
+    if data == THREAD_ACTION:
+        # Nothing is generated yet, only the tone is still missing
+        await query.edit_message_text(
+            text=f"Topic: {user_topic}\n\n🧵 Thread mode. Choose a tone:",
+            reply_markup=tone_keyboard(prompt_registry.current(), thread=True)
+        )
+        return TONE
+
+    if not await check_rate_limit(update, context, 'generate', cost=generation_cost('ab' if data == AB_TEST_ACTION else 'thread' if data.startswith(THREAD_PREFIX) else 'single')):
+        return TONE
     
-    if data == 'AB_TEST':
-        # Generate two variants
-        tone_a = "Professional"
-        tone_b = "Human" # Contrasting simple tone
+    if data == AB_TEST_ACTION:
+        # Generate two variants in the two contrasting tones from the prompt file
+        tone_a, tone_b = prompt_registry.current().ab_tones
+        context.user_data['ab_tones'] = (tone_a, tone_b)
         
         await query.edit_message_text(text=f"Generating A/B variants ({tone_a} vs {tone_b}) for: {user_topic}...")
         
-        tweet_a = llm_service.generate_tweet(user_topic, tone=tone_a)
-        tweet_b = llm_service.generate_tweet(user_topic, tone=tone_b)
+        tweet_a = await asyncio.to_thread(llm_service.generate_tweet, user_topic, tone=tone_a)
+        tweet_b = await asyncio.to_thread(llm_service.generate_tweet, user_topic, tone=tone_b)
         
         if not tweet_a or not tweet_b:
             await context.bot.send_message(
@@ -121,6 +271,31 @@ async def handle_tone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.send_message(chat_id=update.effective_chat.id, text=msg, parse_mode='Markdown')
         return REVIEW
 
+    elif data.startswith(THREAD_PREFIX):
+        tone = data[len(THREAD_PREFIX):]
+        context.user_data['tone'] = tone
+        context.user_data['mode'] = 'thread'
+        
+        await query.edit_message_text(text=f"Generating {tone} thread for: {user_topic}...")
+        
+        thread = await asyncio.to_thread(llm_service.generate_thread, user_topic, tone=tone)
+        
+        if not thread:
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, 
+                text="⚠️ Failed to generate a valid thread. Send me a new topic to try again."
+            )
+            return TOPIC
+
+        context.user_data['thread'] = thread
+        
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id, 
+            text=f"Here is the thread ({tone}, {len(thread)} tweets):\n\n{format_thread(thread)}\n\n"
+                 "Reply with 'send' to post, 'change' to regenerate, attach photos (first tweet), or type a new version."
+        )
+        return REVIEW
+
     else:
         # Single tone
         tone = data
@@ -129,7 +304,7 @@ async def handle_tone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         await query.edit_message_text(text=f"Generating {tone} tweet for: {user_topic}...")
         
-        generated_tweet = llm_service.generate_tweet(user_topic, tone=tone)
+        generated_tweet = await asyncio.to_thread(llm_service.generate_tweet, user_topic, tone=tone)
         
         if not generated_tweet:
             # Send message + return TOPIC to allow retry immediately
@@ -147,6 +322,7 @@ async def handle_tone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return REVIEW
 
+@tracing.traced()
 async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_input = update.message.text
     if user_input:
@@ -154,14 +330,21 @@ async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if user_input.lower() == 'terminate':
              # Use the common check logic manually here since we need to return
              await context.bot.send_message(chat_id=update.effective_chat.id, text="🛑 Operation terminated. Send me a new topic.")
+             clear_session(context.user_data)
              return TOPIC
 
+    if await session_expired(update, context, 'topic', 'mode'):
+        return TOPIC
+
     # Check for Photo
     if update.message.photo:
-        # Get the largest photo file
-        photo_file = await update.message.photo[-1].get_file()
-        file_path = f"temp_{photo_file.file_id}.jpg"
-        await photo_file.download_to_drive(file_path)
+        # Get the largest photo file, skipping the download if we already have it
+        photo = update.message.photo[-1]
+        file_path = media_store.lookup_telegram_file(photo.file_unique_id)
+        if not file_path:
+            photo_file = await photo.get_file()
+            data = await photo_file.download_as_bytearray()
+            file_path = media_store.put_bytes(bytes(data), file_unique_id=photo.file_unique_id)
         
         if 'media_paths' not in context.user_data:
             context.user_data['media_paths'] = []
@@ -175,15 +358,34 @@ async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Handle Regeneration Request
     if user_input.lower() in ['change', 'retry', 'regenerate']:
         user_topic = context.user_data.get('topic')
+
+        if not await check_rate_limit(update, context, 'regenerate', cost=generation_cost(context.user_data.get('mode'))):
+            return REVIEW
         
+        if context.user_data.get('mode') == 'thread':
+            tone = context.user_data.get('tone') or prompt_registry.current().default_tone
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=f"🔄 Regenerating {tone} thread...")
+            
+            thread = await asyncio.to_thread(llm_service.generate_thread, user_topic, tone=tone)
+            
+            if not thread:
+                await context.bot.send_message(chat_id=update.effective_chat.id, text="⚠️ Failed to regenerate. Please edit manually.")
+                return REVIEW
+                
+            context.user_data['thread'] = thread
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, 
+                text=f"🆕 **New Thread** ({tone}):\n\n{format_thread(thread)}\n\nReply 'send' to post, 'change' to try again, or type your own version."
+            )
+            return REVIEW
+
         # Check if we are in A/B mode
         if context.user_data.get('mode') == 'ab':
-            tone_a = "Professional"
-            tone_b = "Human" 
+            tone_a, tone_b = context.user_data.get('ab_tones') or prompt_registry.current().ab_tones
             await context.bot.send_message(chat_id=update.effective_chat.id, text=f"🔄 Regenerating A/B variants for: {user_topic}...")
             
-            tweet_a = llm_service.generate_tweet(user_topic, tone=tone_a)
-            tweet_b = llm_service.generate_tweet(user_topic, tone=tone_b)
+            tweet_a = await asyncio.to_thread(llm_service.generate_tweet, user_topic, tone=tone_a)
+            tweet_b = await asyncio.to_thread(llm_service.generate_tweet, user_topic, tone=tone_b)
             
             if not tweet_a or not tweet_b:
                 await context.bot.send_message(chat_id=update.effective_chat.id, text="⚠️ Failed to regenerate. Please try again or edit manually.")
@@ -203,10 +405,10 @@ async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
         else:
             # Single Tone Mode
-            tone = context.user_data.get('tone', 'Professional')
+            tone = context.user_data.get('tone') or prompt_registry.current().default_tone
             await context.bot.send_message(chat_id=update.effective_chat.id, text=f"🔄 Regenerating {tone} tweet...")
             
-            new_tweet = llm_service.generate_tweet(user_topic, tone=tone)
+            new_tweet = await asyncio.to_thread(llm_service.generate_tweet, user_topic, tone=tone)
             
             if not new_tweet:
                 await context.bot.send_message(chat_id=update.effective_chat.id, text="⚠️ Failed to regenerate. Please edit manually.")
@@ -221,51 +423,204 @@ async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Handle A/B Selection
     if context.user_data.get('mode') == 'ab':
+        tone_a, tone_b = context.user_data.get('ab_tones') or prompt_registry.current().ab_tones
         if user_input.upper() in ['A', 'OPTION A']:
             context.user_data['tweet'] = context.user_data['tweet_a']
+            context.user_data['tone'] = tone_a
             context.user_data['mode'] = 'single' # Switch to single to allow sending next
             await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Selected Option A. Reply 'send' to post it.")
             return REVIEW
         elif user_input.upper() in ['B', 'OPTION B']:
             context.user_data['tweet'] = context.user_data['tweet_b']
+            context.user_data['tone'] = tone_b
             context.user_data['mode'] = 'single'
             await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Selected Option B. Reply 'send' to post it.")
             return REVIEW
 
+    if user_input.lower() == 'send' and context.user_data.get('mode') == 'thread':
+        thread = context.user_data.get('thread')
+        if not thread:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="No thread to send.")
+            return ConversationHandler.END
+
+        # Every tweet of the thread counts against the posting limit
+        if not await check_rate_limit(update, context, 'post', cost=len(thread)):
+            return REVIEW
+
+        await asyncio.to_thread(
+            work_queue.enqueue, 'post_thread',
+            {
+                'segments': thread,
+                'media_paths': context.user_data.get('media_paths', []),
+                'user_id': update.effective_user.id,
+                'metadata': {'source': 'manual', 'tone': context.user_data.get('tone')},
+                'trace_parent': tracing.current_parent()
+            },
+            chat_id=update.effective_chat.id, at_most_once=True
+        )
+        context.user_data['media_paths'] = []
+
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Thread of {len(thread)} tweets queued for posting to X... \u23F3")
+        return ConversationHandler.END
+
     if user_input.lower() == 'send':
         tweet_content = context.user_data.get('tweet')
         media_paths = context.user_data.get('media_paths', [])
         
         if tweet_content:
-            await context.bot.send_message(chat_id=update.effective_chat.id, text="Posting to X...")
-            
-            success = x_service.post_tweet(tweet_content, media_paths=media_paths)
-            
-            # Cleanup temp files
-            for path in media_paths:
-                try:
-                    os.remove(path)
-                except Exception as e:
-                    logging.error(f"Failed to delete temp file {path}: {e}")
-            context.user_data['media_paths'] = [] # Reset
-
-            if success:
-                await context.bot.send_message(chat_id=update.effective_chat.id, text="Posted successfully! \u2705")
-            else:
-                 await context.bot.send_message(chat_id=update.effective_chat.id, text="Failed to post. Check logs/credentials. \u274C")
+            if not await check_rate_limit(update, context, 'post'):
+                return REVIEW
+
+            await asyncio.to_thread(
+                work_queue.enqueue, 'post_tweet',
+                {
+                    'text': tweet_content,
+                    'media_paths': media_paths,
+                    'user_id': update.effective_user.id,
+                    'metadata': {'source': 'manual', 'tone': context.user_data.get('tone')},
+                    'trace_parent': tracing.current_parent()
+                },
+                chat_id=update.effective_chat.id, at_most_once=True
+            )
+            # The photos now belong to the job, relay_results releases them
+            context.user_data['media_paths'] = []
+
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="Queued for posting to X... \u23F3")
         else:
              await context.bot.send_message(chat_id=update.effective_chat.id, text="No tweet to send. If A/B testing, select A or B first.")
         return ConversationHandler.END
+    elif context.user_data.get('mode') == 'thread':
+        # User wants to update the thread
+        thread, problem = parse_thread(user_input)
+        if not thread:
+            await context.bot.send_message(chat_id=update.effective_chat.id, text=f"⚠️ Thread not updated, {problem}.")
+            return REVIEW
+        context.user_data['thread'] = thread
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Updated thread:\n\n{format_thread(thread)}\n\nReply with 'send' to post, attach photos, or type a new version.")
+        return REVIEW
     else:
         # User wants to update the tweet
         context.user_data['tweet'] = user_input
         await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Updated draft:\n\n{user_input}\n\nReply with 'send' to post, attach photos, or type a new version.")
         return REVIEW
 
+async def relay_results(context: ContextTypes.DEFAULT_TYPE):
+    """Periodic job reporting finished worker jobs back to their chats."""
+    jobs = await asyncio.to_thread(work_queue.finished_for_relay)
+    relayed = []
+    for job in jobs:
+        if job['kind'] == 'post_tweet':
+            cleanup_media(job['payload'].get('media_paths'))
+            if job['status'] == 'done' and job['result'] and job['result'].get('success'):
+                text = "Posted successfully! \u2705"
+            elif job['error'] == LEASE_EXPIRED_ERROR:
+                text = "⚠️ Posting was interrupted. Check X before sending again, the tweet may have gone out."
+            else:
+                text = "Failed to post. Check logs/credentials. \u274C"
+            try:
+                await context.bot.send_message(chat_id=job['chat_id'], text=text)
+            except Exception as e:
+                logger.error("Failed to relay result of job %s: %s", job['id'], e)
+        elif job['kind'] == 'post_thread':
+            cleanup_media(job['payload'].get('media_paths'))
+            total = len(job['payload']['segments'])
+            if job['status'] == 'done':
+                text = f"Thread of {total} tweets posted successfully! \u2705"
+            elif job['error'] == LEASE_EXPIRED_ERROR:
+                posted = len(job['payload'].get('posted_ids') or [])
+                text = f"⚠️ Posting was interrupted after {posted}/{total} tweets, the next one may have gone out too. Check X before sending again."
+            else:
+                # Retries resumed from the failed tweet, this is how far they got
+                posted = len(job['payload'].get('posted_ids') or [])
+                text = f"Thread stopped after {posted}/{total} tweets. Check logs/credentials. \u274C"
+            try:
+                await context.bot.send_message(chat_id=job['chat_id'], text=text)
+            except Exception as e:
+                logger.error("Failed to relay result of job %s: %s", job['id'], e)
+        relayed.append(job['id'])
+    await asyncio.to_thread(work_queue.mark_relayed, relayed)
+
+@tracing.traced()
+async def import_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text="📥 Send me a CSV (header with a 'text' column, optional 'theme', 'tone', 'date' as YYYY-MM-DD) "
+             "or a JSONL file with one draft per line. Type 'terminate' to abort."
+    )
+    return IMPORT_FILE
+
+@tracing.traced()
+async def import_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if await check_terminate(update, context):
+        return ConversationHandler.END
+    await context.bot.send_message(chat_id=update.effective_chat.id, text="Please upload a CSV or JSONL file.")
+    return IMPORT_FILE
+
+@tracing.traced()
+async def handle_import_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="⚠️ File is too large (max 20 MB). Split it and try again.")
+        return IMPORT_FILE
+
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Importing {document.file_name}...")
+
+    # Download to disk and parse it row by row in a thread, the file is never loaded whole
+    suffix = os.path.splitext(document.file_name or "")[1].lower() or ".csv"
+    fd, path = tempfile.mkstemp(prefix="import_", suffix=suffix)
+    os.close(fd)
+    try:
+        tg_file = await document.get_file()
+        await tg_file.download_to_drive(path)
+        summary = await asyncio.to_thread(import_drafts, path, draft_store)
+    finally:
+        os.remove(path)
+
+    msg = f"✅ Import finished: {summary['accepted']} drafts accepted, {summary['rejected']} rejected."
+    if summary.get('error'):
+        msg += f"\n⚠️ Import stopped early: {summary['error']}"
+    if summary['rejections']:
+        msg += "\n\nRejected rows (first {}):\n{}".format(len(summary['rejections']), "\n".join(summary['rejections']))
+    msg += f"\n\n📥 Drafts queued for Away Mode: {draft_store.count_queued()}. Use /away to schedule them."
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=msg)
+    return ConversationHandler.END
+
+@tracing.traced()
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await context.bot.send_message(chat_id=update.effective_chat.id, text="Operation cancelled.")
     return ConversationHandler.END
 
+@tracing.traced()
+async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    remaining = ", ".join(f"{action}: {rate_limiter.remaining(user_id, action)}" for action in rate_limiter.limits)
+    await context.bot.send_message(
+        chat_id=update.effective_chat.id,
+        text=(
+            f"📈 **Bot Stats**\n\nRate limits:\n{rate_limiter.get_stats()}\n\nYour remaining quota: {remaining}\n\n"
+            f"{llm_service.get_stats()}\n{work_queue.get_stats()}\n{context.application.update_processor.get_stats()}"
+        )
+    )
+
+@tracing.traced()
+async def performance(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows average engagement of posted tweets per theme and per tone."""
+    sections = []
+    for column, title in (('theme', "By theme"), ('tone', "By tone")):
+        rows = await asyncio.to_thread(metrics_store.aggregates, column)
+        if not rows:
+            continue
+        lines = [
+            f"{row['name']}: {row['posts']} posts, avg engagement {row['avg_engagement']:.1f}"
+            f" (♥ {row['avg_likes'] or 0:.1f}, 🔁 {row['avg_retweets'] or 0:.1f}, 👁 {row['avg_impressions'] or 0:.0f})"
+            for row in rows
+        ]
+        sections.append(f"{title}:\n" + "\n".join(lines))
+
+    text = "\n\n".join(sections) if sections else "No engagement data yet. Metrics are collected periodically after posting."
+    await context.bot.send_message(chat_id=update.effective_chat.id, text=f"📊 Performance\n\n{text}")
+
+@tracing.traced()
 async def automate_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status = automation_service.get_status()
     await context.bot.send_message(
@@ -277,34 +632,54 @@ async def automate_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data['cal_step'] = 'START' # Track which date we are picking
     return AUTO_DATES
 
+@tracing.traced()
 async def handle_calendar_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Both dates are picked on the same message: once the start is chosen the
+    # calendar is edited in place and highlights the range as it is built. The
+    # finished range is shown with a Confirm button; tapping a day instead
+    # starts a new range from that day.
+    if await session_expired(update, context, 'cal_step', restart="Use /away"):
+        return ConversationHandler.END
+    query = update.callback_query
+    step = context.user_data.get('cal_step')
+    range_start = datetime.date.fromisoformat(context.user_data['auto_start']) if step in ('END', 'CONFIRM') else None
+    range_end = datetime.date.fromisoformat(context.user_data['auto_end']) if step == 'CONFIRM' else None
+
+    if query.data == CONFIRM_CALLBACK:
+        await query.answer()
+        if step != 'CONFIRM':
+            return AUTO_DATES
+        context.user_data['cal_step'] = 'DONE'
+        # Dates Done, move to Count; the calendar is no longer needed
+        await query.edit_message_text(
+            text=f"✅ Dates set: {range_start} to {range_end}.\n\nHow many tweets per day? (Enter a number, e.g., 2)"
+        )
+        return AUTO_COUNT
+
     # Process selection
-    selected_date, is_selected = process_calendar_selection(update, context)
+    selected_date, is_selected = await process_calendar_selection(update, context, start=range_start, end=range_end)
     
     if is_selected:
-        step = context.user_data.get('cal_step')
+        picked = datetime.date.fromisoformat(selected_date)
         
-        if step == 'START':
+        # Picking a day before the start, or any day once the range is complete, restarts the range from that day
+        if step != 'END' or picked < range_start:
             context.user_data['auto_start'] = selected_date
+            context.user_data.pop('auto_end', None)
             context.user_data['cal_step'] = 'END'
             
-            # Show next calendar
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id, 
+            await query.edit_message_text(
                 text=f"✅ Start Date: {selected_date}\n\n📆 **Select End Date:**",
-                reply_markup=create_calendar()
+                reply_markup=create_calendar(picked.year, picked.month, start=picked)
             )
             return AUTO_DATES
             
-        elif step == 'END':
-            context.user_data['auto_end'] = selected_date
-            
-            # Dates Done, move to Count
-            await context.bot.send_message(
-                chat_id=update.effective_chat.id, 
-                text=f"✅ Dates set: {context.user_data['auto_start']} to {selected_date}.\n\nHow many tweets per day? (Enter a number, e.g., 2)"
-            )
-            return AUTO_COUNT
+        context.user_data['auto_end'] = selected_date
+        context.user_data['cal_step'] = 'CONFIRM'
+        await query.edit_message_text(
+            text=f"📆 Range: {range_start} to {selected_date}.\n\nTap Confirm, or pick a new start date.",
+            reply_markup=create_calendar(picked.year, picked.month, start=range_start, end=picked)
+        )
             
     return AUTO_DATES
 
@@ -313,6 +688,7 @@ async def check_terminate_auto(update: Update, context: ContextTypes.DEFAULT_TYP
     # Logic similar to check_terminate but might need handled differently if we want to reset entire state
     return await check_terminate(update, context)
 
+@tracing.traced()
 async def auto_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles text input during AUTO dates (for terminate) and AUTO count."""
     if await check_terminate(update, context):
@@ -323,17 +699,23 @@ async def auto_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Actually, we can just look at state if we were inside the handler... but standard handlers are separate.
     return AUTO_DATES 
 
+@tracing.traced()
 async def auto_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if await check_terminate(update, context):
         return ConversationHandler.END
+    if context.user_data.get('cal_step') not in (None, 'DONE'):
+        # Text typed while the calendar is still open
+        await context.bot.send_message(chat_id=update.effective_chat.id, text="Please pick the dates on the calendar above, or type 'terminate' to abort.")
+        return AUTO_DATES
+    if await session_expired(update, context, 'auto_start', 'auto_end', restart="Use /away"):
+        return ConversationHandler.END
 
     text = update.message.text.strip()
     if text.isdigit():
         context.user_data['auto_count'] = int(text)
         
-        # Predefined themes
-        themes = ["AI News", "Python Tips", "Tech Humor", "Coding Life", "Motivation", "Startup Advice", "Deep Learning"]
-        context.user_data['available_themes'] = themes
+        # Themes come from the prompt file
+        context.user_data['available_themes'] = list(prompt_registry.current().themes)
         context.user_data['selected_themes'] = []
         
         await show_theme_selection(update, context)
@@ -343,10 +725,9 @@ async def auto_count(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.send_message(chat_id=update.effective_chat.id, text="Please enter a valid number.")
         return AUTO_COUNT
 
-async def show_theme_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    themes = context.user_data.get('available_themes', [])
-    selected = context.user_data.get('selected_themes', [])
-    
+@functools.lru_cache(maxsize=256)
+def theme_keyboard(themes: tuple, selected: frozenset) -> InlineKeyboardMarkup:
+    """Theme toggle buttons; every toggle re-renders this, so each selection state is built once."""
     keyboard = []
     row = []
     for theme in themes:
@@ -360,7 +741,13 @@ async def show_theme_selection(update: Update, context: ContextTypes.DEFAULT_TYP
         keyboard.append(row)
     
     keyboard.append([InlineKeyboardButton("Done ✅", callback_data=DONE_ACTION)])
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+async def show_theme_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    themes = context.user_data.get('available_themes', [])
+    selected = context.user_data.get('selected_themes', [])
+    
+    reply_markup = theme_keyboard(tuple(themes), frozenset(selected))
     
     text = "Select themes (pick at least 1):"
     if selected:
@@ -371,9 +758,12 @@ async def show_theme_selection(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         await context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=reply_markup)
 
+@tracing.traced()
 async def handle_theme_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
+    if await session_expired(update, context, 'auto_start', 'auto_end', 'auto_count', restart="Use /away"):
+        return ConversationHandler.END
     data = query.data
     
     if data == DONE_ACTION:
@@ -410,7 +800,18 @@ if __name__ == '__main__':
         print("Error: TELEGRAM_BOT_TOKEN not found in .env")
         exit(1)
 
-    application = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).build()
+    # Chats are processed in parallel, but each chat's updates stay in order so the
+    # conversation state machines below keep working.
+    update_processor = ChatOrderedUpdateProcessor(
+        max_concurrent_updates=config.UPDATE_CONCURRENCY,
+        max_pending_per_chat=config.UPDATE_MAX_PENDING_PER_CHAT,
+        max_queued_updates=config.UPDATE_MAX_QUEUED
+    )
+    builder = ApplicationBuilder().token(config.TELEGRAM_BOT_TOKEN).concurrent_updates(update_processor)
+    if tracing.tracer.enabled:
+        # Same pool size as the builder's default request, plus a span per Bot API call
+        builder = builder.request(TracedHTTPXRequest(connection_pool_size=256))
+    application = builder.build()
 
     # Define user filter
     user_filter = filters.ALL
@@ -418,6 +819,7 @@ if __name__ == '__main__':
         try:
             user_id = int(config.ALLOWED_TELEGRAM_USER_ID)
             user_filter = filters.User(user_id=user_id)
+            allowed_user_id = user_id
             print(f"Restricting access to user ID: {user_id}")
         except ValueError:
             print("Error: ALLOWED_TELEGRAM_USER_ID is not a valid integer. Allowed checks disabled.")
@@ -435,8 +837,10 @@ if __name__ == '__main__':
                 MessageHandler(filters.TEXT & (~filters.COMMAND) & user_filter, handle_tone_input)
             ],
             REVIEW: [MessageHandler((filters.TEXT | filters.PHOTO) & (~filters.COMMAND) & user_filter, handle_review)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
-        fallbacks=[CommandHandler('cancel', cancel, filters=user_filter)]
+        fallbacks=[CommandHandler('cancel', cancel, filters=user_filter)],
+        conversation_timeout=config.SESSION_IDLE_TIMEOUT
     )
 
     auto_handler = ConversationHandler(
@@ -448,13 +852,36 @@ if __name__ == '__main__':
             ],
             AUTO_COUNT: [MessageHandler(filters.TEXT & (~filters.COMMAND) & user_filter, auto_count)],
             AUTO_THEMES: [CallbackQueryHandler(handle_theme_selection)],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
+        },
+        fallbacks=[CommandHandler('cancel', cancel, filters=user_filter)],
+        conversation_timeout=config.SESSION_IDLE_TIMEOUT
+    )
+
+
+    import_handler = ConversationHandler(
+        entry_points=[CommandHandler('import', import_start, filters=user_filter)],
+        states={
+            IMPORT_FILE: [
+                MessageHandler(filters.Document.ALL & user_filter, handle_import_file),
+                MessageHandler(filters.TEXT & (~filters.COMMAND) & user_filter, import_text_input)
+            ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timeout)],
         },
-        fallbacks=[CommandHandler('cancel', cancel, filters=user_filter)]
+        fallbacks=[CommandHandler('cancel', cancel, filters=user_filter)],
+        conversation_timeout=config.SESSION_IDLE_TIMEOUT
     )
 
+    # Session bookkeeping runs before the conversation handlers
+    application.add_handler(TypeHandler(Update, track_session), group=-1)
+    application.job_queue.run_repeating(sweep_sessions, interval=max(config.SESSION_IDLE_TIMEOUT // 4, 60))
+    application.job_queue.run_repeating(relay_results, interval=config.WORKER_RELAY_INTERVAL)
 
+    application.add_handler(import_handler)
     application.add_handler(auto_handler)
     application.add_handler(conv_handler)
+    application.add_handler(CommandHandler('stats', stats, filters=user_filter))
+    application.add_handler(CommandHandler('performance', performance, filters=user_filter))
 
 
     # Run the bot
@@ -465,7 +892,7 @@ if __name__ == '__main__':
     
     if webhook_url and not is_polling:
         port = int(os.getenv("PORT", "8443"))
-        logging.info(f"Starting in WEBHOOK mode on port {port}...")
+        logger.info("Starting in WEBHOOK mode on port %s...", port)
         
         application.run_webhook(
             listen="0.0.0.0",
@@ -474,5 +901,5 @@ if __name__ == '__main__':
             webhook_url=f"{webhook_url}/{config.TELEGRAM_BOT_TOKEN}"
         )
     else:
-        logging.info("Starting in POLLING mode...")
+        logger.info("Starting in POLLING mode...")
         application.run_polling()
@@ -1,36 +1,122 @@
+import contextlib
 import json
 import logging
 import random
 import datetime
 import os
+import config as app_config
+from services import llm_service as llm, x_service as x
 from services.llm_service import LLMService
 from services.x_service import XService
+from services.draft_store import DraftStore
+from services.metrics_store import MetricsStore
+from services.theme_selector import ThemeSelector, engagement_reward
+from services.prompt_registry import get_registry
+from utils.sqlite import connect
 
-STATE_FILE = "automation_state.json"
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS automation_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Top-level entries of the state, each stored as one JSON row
+STATE_KEYS = ('config', 'daily_stats', 'bandit')
+# Failures that say something about the generated content; outages, rate limits
+# and credential problems don't, and are kept out of the theme selector
+CONTENT_REFUSALS = frozenset((llm.REJECTED, x.DUPLICATE, x.INVALID))
+
+# Where the state lived before it moved to SQLite; imported once into an empty database
+LEGACY_STATE_FILE = "automation_state.json"
 
 class AutomationService:
-    def __init__(self):
-        self.llm_service = LLMService()
-        self.x_service = XService()
+    def __init__(self, llm_service: LLMService = None, x_service: XService = None,
+                 clock=None, rng: random.Random = None, state_db: str = app_config.AUTOMATION_DB,
+                 draft_store: DraftStore = None, metrics_store: MetricsStore = None):
+        """
+        `clock` (a callable returning the current datetime) and `rng` can be injected
+        to run the scheduling logic in virtual time. With `state_db=None` the
+        state is kept in memory only. Imported drafts in `draft_store` are posted
+        before anything is generated. Engagement from `metrics_store` steers which
+        theme/style/tone gets generated. Without `x_service` one is created on the
+        first post, so a process that only configures Away Mode (the bot) never
+        sets up X, its media and metrics stores.
+        """
+        self.llm_service = llm_service or LLMService()
+        self._x_service = x_service
+        self.clock = clock or datetime.datetime.now
+        self.rng = rng or random.Random()
+        self.state_db = state_db
+        self.draft_store = draft_store
+        self.metrics_store = metrics_store
+        self.state = {}
+        if self.state_db:
+            with connect(self.state_db) as conn:
+                conn.executescript(SCHEMA)
+            self._import_legacy_state()
         self.load_state()
 
+    @property
+    def x_service(self) -> XService:
+        if self._x_service is None:
+            self._x_service = XService()
+        return self._x_service
+
+    @staticmethod
+    def _read(conn) -> dict:
+        return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM automation_state")}
+
+    def _import_legacy_state(self):
+        if not os.path.exists(LEGACY_STATE_FILE):
+            return
+        with connect(self.state_db) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM automation_state LIMIT 1").fetchone() is None:
+                try:
+                    with open(LEGACY_STATE_FILE, 'r') as f:
+                        legacy = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.error("Failed to import %s: %s", LEGACY_STATE_FILE, e)
+                    legacy = {}
+                conn.executemany(
+                    "INSERT INTO automation_state (key, value) VALUES (?, ?)",
+                    [(key, json.dumps(legacy[key])) for key in STATE_KEYS if key in legacy]
+                )
+                if legacy:
+                    logger.info("Imported automation state from %s.", LEGACY_STATE_FILE)
+            conn.execute("COMMIT")
+
     def load_state(self):
-        if os.path.exists(STATE_FILE):
-            try:
-                with open(STATE_FILE, 'r') as f:
-                    self.state = json.load(f)
-            except Exception as e:
-                logging.error(f"Failed to load automation state: {e}")
-                self.state = {}
-        else:
-            self.state = {}
-
-    def save_state(self):
-        try:
-            with open(STATE_FILE, 'w') as f:
-                json.dump(self.state, f, indent=4)
-        except Exception as e:
-            logging.error(f"Failed to save automation state: {e}")
+        """Replaces `self.state` with the stored version (a no-op for in-memory state)."""
+        if not self.state_db:
+            return
+        with connect(self.state_db) as conn:
+            self.state = self._read(conn)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Read-modify-write of the state, shared by the bot and all posting workers.
+
+        Yields the freshly loaded state under SQLite's write lock and stores it
+        when the block ends, so an update never overwrites what another process
+        saved in the meantime. Keep the block short, LLM and X calls go outside.
+        """
+        if not self.state_db:
+            yield self.state
+            return
+        with connect(self.state_db) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self.state = self._read(conn)
+            yield self.state
+            conn.executemany(
+                "INSERT OR REPLACE INTO automation_state (key, value) VALUES (?, ?)",
+                [(key, json.dumps(self.state[key])) for key in STATE_KEYS if key in self.state]
+            )
+            conn.execute("COMMIT")
 
     def start_automation(self, start_date_str, end_date_str, tweets_per_day, themes):
         """
@@ -38,21 +124,22 @@ class AutomationService:
         Dates should be in YYYY-MM-DD format.
         Themes is a list of strings.
         """
-        self.state['config'] = {
-            'start_date': start_date_str,
-            'end_date': end_date_str,
-            'tweets_per_day': int(tweets_per_day),
-            'themes': themes
-        }
-        self.state['daily_stats'] = {
-            'date': datetime.datetime.now().strftime("%Y-%m-%d"),
-            'count': 0
-        }
-        self.save_state()
-        logging.info(f"Automation configured: {self.state['config']}")
+        with self._transaction() as state:
+            state['config'] = {
+                'start_date': start_date_str,
+                'end_date': end_date_str,
+                'tweets_per_day': int(tweets_per_day),
+                'themes': themes
+            }
+            state['daily_stats'] = {
+                'date': self.clock().strftime("%Y-%m-%d"),
+                'count': 0
+            }
+        logger.info("Automation configured: %s", self.state['config'])
         return True
 
     def get_status(self):
+        self.load_state()
         config = self.state.get('config')
         if not config:
             return "Automation is NOT configured."
@@ -62,54 +149,124 @@ class AutomationService:
             f"🔢 Target: {config['tweets_per_day']} tweets/day\n"
             f"📝 Themes: {', '.join(config['themes'])}\n"
             f"📊 Today's Count: {self.state.get('daily_stats', {}).get('count', 0)}"
+            + (f"\n📥 Queued Drafts: {self.draft_store.count_queued()}" if self.draft_store else "")
         )
 
     def check_and_post(self):
         """
         Main logic to be called by the scheduler.
+
+        The decision to post reserves a slot in today's count within one
+        transaction; a failed post gives it back. Concurrent ticks therefore
+        never post more than tweets_per_day, and no lock is held while the
+        LLM and X are called.
         """
-        logging.info("Checking automation status...")
-        config = self.state.get('config')
-        if not config:
-            logging.info("No automation config found.")
+        logger.debug("Checking automation status...")
+        today_str = self.clock().strftime("%Y-%m-%d")
+
+        with self._transaction() as state:
+            config = self._due_config(state, today_str)
+            if not config:
+                return
+
+            # 4. Post an imported draft if one is due; claimed now so no other tick posts it too
+            draft = self.draft_store.claim_next(today_str) if self.draft_store else None
+            if not draft:
+                selector = ThemeSelector(state.setdefault('bandit', {}), rng=self.rng, decay=app_config.BANDIT_DECAY)
+                self._credit_engagement(selector)
+                prompts = get_registry().current()
+                theme, style, tone = selector.select(config['themes'], prompts.styles, list(prompts.tones))
+
+            state['daily_stats']['count'] += 1
+            count = state['daily_stats']['count']
+
+        if draft:
+            logger.info("Automation Triggered! Posting imported draft %s", draft['id'])
+            success = self.x_service.post_tweet(
+                draft['text'],
+                metadata={'source': 'draft', 'theme': draft['theme'], 'tone': draft['tone']}
+            )
+            # A failed draft is not retried, X would most likely reject it again
+            self.draft_store.mark(draft['id'], 'posted' if success else 'failed')
+            if success:
+                logger.info("Automated draft posted! Count today: %s", count)
+            else:
+                with self._transaction() as state:
+                    self._release_slot(state, today_str)
+                logger.error("Failed to post imported draft %s.", draft['id'])
             return
 
-        today_str = datetime.datetime.now().strftime("%Y-%m-%d")
+        # 5. Generate and Post
+        logger.info("Automation Triggered! Theme: %s, Style: %s, Tone: %s", theme, style, tone)
         
+        tweet_content = self.llm_service.generate_tweet(
+            topic=theme, 
+            tone=tone,
+            style_instruction=style
+        )
+        
+        # The tweet ID, or a Refusal from whichever step failed
+        outcome = tweet_content
+        if tweet_content:
+            outcome = self.x_service.post_tweet(
+                tweet_content,
+                metadata={'source': 'automation', 'theme': theme, 'tone': tone, 'style': style}
+            )
+            if outcome:
+                # The reward arrives later with the engagement metrics
+                logger.info("Automated tweet posted! Count today: %s", count)
+            else:
+                logger.error("Failed to post automated tweet.")
+
+        if not outcome:
+            reason = getattr(outcome, 'reason', None)
+            with self._transaction() as state:
+                self._release_slot(state, today_str)
+                # Rejected generations and duplicate/invalid posts count against the combination
+                if reason in CONTENT_REFUSALS:
+                    ThemeSelector(state.setdefault('bandit', {}), rng=self.rng, decay=app_config.BANDIT_DECAY).record(theme, style, tone, 0.0)
+            if reason not in CONTENT_REFUSALS:
+                logger.info("Not counted against %s/%s/%s: %s", theme, style, tone, reason or "unknown failure")
+
+    def _due_config(self, state: dict, today_str: str) -> dict:
+        """The config if a post is due on this tick, else None. Updates `state` for a new day or an ended range."""
+        config = state.get('config')
+        if not config:
+            logger.debug("No automation config found.")
+            return None
+
         # 1. Check Date Range
         try:
             start_date = datetime.datetime.strptime(config['start_date'], "%Y-%m-%d").date()
             end_date = datetime.datetime.strptime(config['end_date'], "%Y-%m-%d").date()
-            current_date = datetime.datetime.now().date()
+            current_date = self.clock().date()
             
             if current_date > end_date:
-                logging.info(f"Automation COMPLETED: Current date {current_date} is past end date {end_date}. Clearing config.")
-                self.state['config'] = None
-                self.save_state()
-                return
+                logger.info("Automation COMPLETED: Current date %s is past end date %s. Clearing config.", current_date, end_date)
+                state['config'] = None
+                return None
 
             if current_date < start_date:
-                logging.info(f"Automation skipped: Current date {current_date} is before start date {start_date}.")
-                return
+                logger.info("Automation skipped: Current date %s is before start date %s.", current_date, start_date)
+                return None
         except ValueError as e:
-            logging.error(f"Date parsing error in automation config: {e}")
-            return
+            logger.error("Date parsing error in automation config: %s", e)
+            return None
 
         # 2. Check Daily Limit
-        daily_stats = self.state.get('daily_stats', {'date': today_str, 'count': 0})
+        daily_stats = state.get('daily_stats', {'date': today_str, 'count': 0})
         
         # Reset stats if it's a new day
         if daily_stats['date'] != today_str:
             daily_stats = {'date': today_str, 'count': 0}
-            self.state['daily_stats'] = daily_stats
-            self.save_state()
+        state['daily_stats'] = daily_stats
 
         if daily_stats['count'] >= config['tweets_per_day']:
-            logging.info(f"Automation skipped: Daily limit of {config['tweets_per_day']} reached.")
-            return
+            logger.info("Automation skipped: Daily limit of %s reached.", config['tweets_per_day'])
+            return None
 
         # 3. Dynamic Urgency (Catch-Up Logic)
-        now = datetime.datetime.now()
+        now = self.clock()
         end_of_day = now.replace(hour=23, minute=59, second=59)
         minutes_left = (end_of_day - now).total_seconds() / 60
         intervals_left = max(minutes_left / 30, 0.5) # Avoid div/0, assume at least 0.5 intervals
@@ -123,42 +280,29 @@ class AutomationService:
         
         if probability < 0: probability = 0
 
-        logging.info(f"Dynamic Check: Needed={needed}, TimeLeft={int(minutes_left)}m, Intervals={intervals_left:.1f}, Prob={probability:.2f}")
+        logger.debug("Dynamic Check: Needed=%s, TimeLeft=%sm, Intervals=%.1f, Prob=%.2f", needed, int(minutes_left), intervals_left, probability)
 
-        if random.random() > probability: 
-             logging.info(f"Automation skipped: Rolled dice against P={probability:.2f}")
-             return
+        if self.rng.random() > probability: 
+             logger.debug("Automation skipped: Rolled dice against P=%.2f", probability)
+             return None
+        return config
 
-        # 4. Generate and Post
-        theme = random.choice(config['themes'])
-        
-        styles = [
-            "Use a metaphor to explain.",
-            "Ask a thought-provoking question.",
-            "Make a controversial but defensible statement.",
-            "Share a quick tip or 'did you know'.",
-            "Use a 'unpopular opinion' format.",
-            "Connect this to a historical event.",
-            "Explain it like I'm 5 (ELI5).",
-            "Be sarcastic and witty.",
-            "Be strictly professional and data-driven."
-        ]
-        style = random.choice(styles)
-        
-        logging.info(f"Automation Triggered! Theme: {theme}, Style: {style}")
-        
-        tweet_content = self.llm_service.generate_tweet(
-            topic=theme, 
-            tone="Professional", # internal default, overridden mostly by style instruction
-            style_instruction=style
-        )
-        
-        if tweet_content:
-            success = self.x_service.post_tweet(tweet_content)
-            if success:
-                # Update State
-                self.state['daily_stats']['count'] += 1
-                self.save_state()
-                logging.info(f"Automated tweet posted! Count today: {self.state['daily_stats']['count']}")
-            else:
-                logging.error("Failed to post automated tweet.")
+    @staticmethod
+    def _release_slot(state: dict, today_str: str):
+        """Gives back the slot reserved for a post that failed, unless the day or config changed since."""
+        daily_stats = state.get('daily_stats')
+        if daily_stats and daily_stats['date'] == today_str and daily_stats['count'] > 0:
+            daily_stats['count'] -= 1
+
+    def _credit_engagement(self, selector: ThemeSelector):
+        """Feeds matured engagement of earlier automated posts back into the selector."""
+        if not self.metrics_store:
+            return
+        rows = self.metrics_store.uncredited_engagement(min_age_seconds=app_config.BANDIT_REWARD_MIN_AGE_HOURS * 3600)
+        for row in rows:
+            if row['theme'] and row['style'] and row['tone']:
+                selector.record(row['theme'], row['style'], row['tone'],
+                                engagement_reward(row['engagement'], app_config.BANDIT_REWARD_SCALE))
+        self.metrics_store.mark_credited([row['tweet_id'] for row in rows])
+        if rows:
+            logger.info("Credited engagement of %s posts to the theme selector.", len(rows))
@@ -0,0 +1,181 @@
+"""
+Fast-forward simulator for Away Mode campaigns.
+
+Replays a whole campaign through AutomationService.check_and_post in virtual
+time, with stubbed LLM and X services, and reports how the scheduling logic
+behaved: posts per day, missed quotas, spacing between posts and how many
+LLM/API calls it made.
+
+Usage:
+    python -m services.automation_simulator --start 2025-01-01 --end 2025-01-30 --per-day 3
+"""
+import argparse
+import collections
+import datetime
+import logging
+import random
+import statistics
+from services.automation_service import AutomationService
+
+DEFAULT_THEMES = ["AI News", "Python Tips", "Tech Humor"]
+
+
+class VirtualClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self, start: datetime.datetime):
+        self.now = start
+
+    def __call__(self) -> datetime.datetime:
+        return self.now
+
+    def advance(self, delta: datetime.timedelta):
+        self.now += delta
+
+
+class StubLLMService:
+    """Stands in for LLMService, failing a configurable share of generations."""
+
+    def __init__(self, rng: random.Random, failure_rate: float = 0.0):
+        self.rng = rng
+        self.failure_rate = failure_rate
+        self.calls = 0
+
+    def generate_tweet(self, topic: str, tone: str = "Professional", style_instruction: str = None) -> str:
+        self.calls += 1
+        if self.rng.random() < self.failure_rate:
+            return None
+        return f"Simulated tweet #{self.calls} about {topic}"
+
+
+class StubXService:
+    """Stands in for XService and records the virtual time of every post."""
+
+    def __init__(self, clock: VirtualClock, rng: random.Random, failure_rate: float = 0.0):
+        self.clock = clock
+        self.rng = rng
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.posted_at = []
+
+    def post_tweet(self, text: str, media_paths: list[str] = None, metadata: dict = None):
+        self.calls += 1
+        if self.rng.random() < self.failure_rate:
+            return False
+        self.posted_at.append(self.clock())
+        return str(self.calls)
+
+
+def simulate(start_date: str, end_date: str, tweets_per_day: int, themes: list[str] = None,
+             interval_minutes: int = 30, seed: int = None,
+             llm_failure_rate: float = 0.0, post_failure_rate: float = 0.0) -> dict:
+    """
+    Runs one campaign from `start_date` to `end_date` (YYYY-MM-DD, inclusive),
+    calling check_and_post every `interval_minutes` like the real scheduler.
+    """
+    rng = random.Random(seed)
+    first_day = datetime.datetime.strptime(start_date, "%Y-%m-%d")
+    last_day = datetime.datetime.strptime(end_date, "%Y-%m-%d")
+    clock = VirtualClock(first_day)
+    llm = StubLLMService(rng, llm_failure_rate)
+    x = StubXService(clock, rng, post_failure_rate)
+
+    service = AutomationService(llm_service=llm, x_service=x, clock=clock, rng=rng, state_db=None)
+    service.start_automation(start_date, end_date, tweets_per_day, themes or DEFAULT_THEMES)
+
+    # The scheduler fires at the end of each interval, just like APScheduler's first run
+    step = datetime.timedelta(minutes=interval_minutes)
+    stop = last_day + datetime.timedelta(days=1)
+    ticks = 0
+    while clock.now < stop:
+        clock.advance(step)
+        service.check_and_post()
+        ticks += 1
+
+    return _build_report(x.posted_at, first_day.date(), last_day.date(), tweets_per_day, ticks, llm.calls, x.calls)
+
+
+def _build_report(posted_at, first_day, last_day, tweets_per_day, ticks, llm_calls, api_calls) -> dict:
+    per_day = collections.OrderedDict()
+    day = first_day
+    while day <= last_day:
+        per_day[day.isoformat()] = 0
+        day += datetime.timedelta(days=1)
+    for ts in posted_at:
+        key = ts.date().isoformat()
+        if key in per_day:
+            per_day[key] += 1
+
+    missed_days = {day: tweets_per_day - count for day, count in per_day.items() if count < tweets_per_day}
+    gaps = [(b - a).total_seconds() / 60 for a, b in zip(posted_at, posted_at[1:])]
+    hours = collections.Counter(ts.hour for ts in posted_at)
+
+    spacing = {}
+    if gaps:
+        spacing = {
+            'min': min(gaps),
+            'median': statistics.median(gaps),
+            'mean': statistics.mean(gaps),
+            'max': max(gaps),
+        }
+        if len(gaps) >= 2:
+            q1, _, q3 = statistics.quantiles(gaps, n=4)
+            spacing['p25'], spacing['p75'] = q1, q3
+
+    return {
+        'ticks': ticks,
+        'posts': len(posted_at),
+        'per_day': dict(per_day),
+        'missed_days': missed_days,
+        'missed_posts': sum(missed_days.values()),
+        'spacing_minutes': spacing,
+        'posts_by_hour': dict(sorted(hours.items())),
+        'llm_calls': llm_calls,
+        'api_calls': api_calls,
+    }
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"Ticks simulated: {report['ticks']}",
+        f"Posts: {report['posts']}",
+        f"LLM calls: {report['llm_calls']}, X API calls: {report['api_calls']}",
+        f"Missed quota on {len(report['missed_days'])} days ({report['missed_posts']} posts short)",
+    ]
+    spacing = report['spacing_minutes']
+    if spacing:
+        lines.append("Spacing (minutes): " + ", ".join(f"{k}={v:.0f}" for k, v in spacing.items()))
+
+    lines.append("Posts by hour: " + " ".join(f"{h:02d}h:{c}" for h, c in report['posts_by_hour'].items()))
+    lines.append("Per day:")
+    for day, count in report['per_day'].items():
+        marker = "" if day not in report['missed_days'] else f"  (missed {report['missed_days'][day]})"
+        lines.append(f"  {day}: {count}{marker}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an Away Mode campaign in virtual time.")
+    parser.add_argument("--start", required=True, help="start date, YYYY-MM-DD")
+    parser.add_argument("--end", required=True, help="end date, YYYY-MM-DD")
+    parser.add_argument("--per-day", type=int, default=2, help="tweets per day")
+    parser.add_argument("--themes", nargs="+", default=DEFAULT_THEMES)
+    parser.add_argument("--interval", type=int, default=30, help="scheduler interval in minutes")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--post-failure-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true", help="show AutomationService logs")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    report = simulate(
+        args.start, args.end, args.per_day, args.themes,
+        interval_minutes=args.interval, seed=args.seed,
+        llm_failure_rate=args.llm_failure_rate, post_failure_rate=args.post_failure_rate
+    )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
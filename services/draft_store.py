@@ -0,0 +1,88 @@
+import itertools
+import time
+import config
+from utils.sqlite import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    text TEXT NOT NULL,
+    theme TEXT,
+    tone TEXT,
+    scheduled_date TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    created_at REAL NOT NULL,
+    posted_at REAL
+);
+CREATE INDEX IF NOT EXISTS drafts_next ON drafts (status, scheduled_date, id);
+"""
+
+
+class DraftStore:
+    """
+    Pre-written posts waiting to be published by Away Mode.
+
+    Drafts are kept in SQLite so imports of any size never sit in memory. A
+    draft with a `scheduled_date` (YYYY-MM-DD) is not posted before that day;
+    undated drafts are used in import order. A draft is claimed ('posting')
+    before it goes out and marked 'posted' or 'failed' afterwards, so it is
+    posted at most once, even if the poster crashes in between.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.DRAFTS_DB
+        with connect(self.path) as conn:
+            conn.executescript(SCHEMA)
+
+    def add_many(self, drafts, batch_size: int = 500) -> int:
+        """
+        Inserts drafts from any iterable of dicts (text, theme, tone, scheduled_date),
+        consuming it in batches. Returns the number of inserted drafts.
+        """
+        iterator = iter(drafts)
+        total = 0
+        with connect(self.path) as conn:
+            while True:
+                batch = list(itertools.islice(iterator, batch_size))
+                if not batch:
+                    break
+                now = time.time()
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT INTO drafts (text, theme, tone, scheduled_date, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(d['text'], d.get('theme'), d.get('tone'), d.get('scheduled_date'), now) for d in batch]
+                )
+                conn.execute("COMMIT")
+                total += len(batch)
+        return total
+
+    def claim_next(self, today: str) -> dict:
+        """Takes the draft to post next on `today` (YYYY-MM-DD) by setting it to 'posting'. None if none is due."""
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Dated drafts that are due come first, oldest date first, then undated ones
+            row = conn.execute(
+                "SELECT * FROM drafts WHERE status = 'queued' AND (scheduled_date IS NULL OR scheduled_date <= ?) "
+                "ORDER BY scheduled_date IS NULL, scheduled_date, id LIMIT 1",
+                (today,)
+            ).fetchone()
+            if row is not None:
+                claimed = conn.execute(
+                    "UPDATE drafts SET status = 'posting' WHERE id = ? AND status = 'queued'", (row['id'],)
+                ).rowcount
+                if not claimed:
+                    row = None
+            conn.execute("COMMIT")
+        return dict(row, status='posting') if row else None
+
+    def mark(self, draft_id: int, status: str):
+        """Marks a claimed draft as 'posted' or 'failed'."""
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE drafts SET status = ?, posted_at = ? WHERE id = ?",
+                (status, time.time(), draft_id)
+            )
+
+    def count_queued(self) -> int:
+        with connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM drafts WHERE status = 'queued'").fetchone()[0]
@@ -0,0 +1,100 @@
+import importlib.util
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class ImageService:
+    """
+    Shrinks photos before they are uploaded to X.
+
+    Each image is downscaled to fit X's display resolution, re-encoded as JPEG
+    at the configured quality and written without EXIF/metadata. Images are
+    processed concurrently in a thread pool (Pillow releases the GIL while
+    decoding, resizing and encoding). Requires Pillow; without it images are
+    passed through unchanged.
+    """
+
+    def __init__(self, max_dimension: int = None, quality: int = None, workers: int = None):
+        self.max_dimension = max_dimension or config.IMAGE_MAX_DIMENSION
+        self.quality = quality or config.IMAGE_QUALITY
+        self.enabled = config.IMAGE_PREPROCESS
+
+        # Pillow itself is only imported once the first image is processed
+        if self.enabled and importlib.util.find_spec("PIL") is None:
+            logger.warning("Pillow is not installed. Image preprocessing is disabled.")
+            self.enabled = False
+
+        self._pool = ThreadPoolExecutor(max_workers=workers or config.IMAGE_WORKERS, thread_name_prefix="image")
+        self.last_report = []
+
+    def preprocess(self, paths: list[str]) -> list[str]:
+        """
+        Returns the paths to upload, in the same order as `paths`.
+        Images that cannot be processed (or would grow) are returned untouched.
+        """
+        if not self.enabled or not paths:
+            return paths
+
+        results = list(self._pool.map(self._process_one, paths))
+        self.last_report = [report for _, report in results]
+
+        total_saved = sum(report['bytes_saved'] for report in self.last_report)
+        logger.info("Preprocessed %s images, saved %.0f KB in total.", len(paths), total_saved / 1024)
+        return [path for path, _ in results]
+
+    def _output_path(self, path: str) -> str:
+        base, _ = os.path.splitext(path)
+        # Settings are part of the name so a config change never reuses stale output
+        return f"{base}_{self.max_dimension}_{self.quality}.jpg"
+
+    def _process_one(self, path: str):
+        from PIL import Image, ImageOps
+
+        start = time.perf_counter()
+        out_path = self._output_path(path)
+        report = {'path': path, 'bytes_before': 0, 'bytes_after': 0, 'bytes_saved': 0, 'seconds': 0.0}
+
+        try:
+            report['bytes_before'] = os.path.getsize(path)
+
+            try:
+                # Reused output is touched first: the bot's media GC deletes unreferenced
+                # files by mtime, and must not remove it before it is uploaded
+                os.utime(out_path)
+                reused = True
+            except FileNotFoundError:
+                reused = False
+
+            if not reused:
+                with Image.open(path) as img:
+                    # Apply the EXIF rotation before the metadata is dropped
+                    img = ImageOps.exif_transpose(img)
+                    img.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+                    if img.mode != "RGB":
+                        img = img.convert("RGB")
+                    tmp_path = out_path + ".tmp"
+                    img.save(tmp_path, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+                    os.replace(tmp_path, out_path)
+
+            report['bytes_after'] = os.path.getsize(out_path)
+            if report['bytes_after'] >= report['bytes_before']:
+                # Already small enough, keep the original
+                report['bytes_after'] = report['bytes_before']
+                out_path = path
+        except Exception as e:
+            logger.error("Image preprocessing failed for %s: %s", path, e)
+            report['bytes_after'] = report['bytes_before']
+            out_path = path
+
+        report['bytes_saved'] = report['bytes_before'] - report['bytes_after']
+        report['seconds'] = time.perf_counter() - start
+        logger.debug(
+            "Image %s: %.0f KB -> %.0f KB in %.0f ms", os.path.basename(path),
+            report['bytes_before'] / 1024, report['bytes_after'] / 1024, report['seconds'] * 1000
+        )
+        return out_path, report
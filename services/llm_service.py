@@ -1,148 +1,282 @@
-import google.generativeai as genai
 import config
+import contextvars
 import logging
-from groq import Groq
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from services.prompt_registry import get_registry
+from utils.single_flight import SingleFlight
+from utils.refusal import Refusal
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+# Provider SDKs are slow to import, so they are only loaded on first use
+# and never for providers without an API key.
+GEMINI_MODEL = 'gemini-2.5-flash'
+
+MAX_TWEET_LENGTH = 280
+FORBIDDEN_PHRASES = [
+    "I cannot", "I can't", "I am an AI", "large language model",
+    "Generate a tweet", "Here is a tweet", "Sure!", "Okay,"
+]
+
+# Refusal reasons of generate_tweet
+UNAVAILABLE = "unavailable"     # no provider returned anything
+REJECTED = "rejected"           # the text failed validation (length, forbidden phrase)
+
+# Threads are split on "1/", "1/5", "(1/5)" or "1/5:" numbers at the start of a
+# line. Only output without any of those is split on "2." or "3)", which are list
+# items otherwise. A marker is followed by whitespace, and numbers must count up
+# from 1 (and not past the total), so "24/7 uptime" stays text.
+MAX_THREAD_SEGMENTS = 10
+THREAD_MARKER = re.compile(r"^[ \t]*\(?(?P<index>\d{1,2})[ \t]*/[ \t]*(?P<total>\d{0,2})\)?[:.]?(?=\s|$)[ \t]*", re.MULTILINE)
+LIST_MARKER = re.compile(r"^[ \t]*\(?(?P<index>\d{1,2})[.):](?=\s|$)[ \t]*", re.MULTILINE)
+# Bold/italic around the numbers ("**1/**"), removed before looking for markers
+EMPHASIS = re.compile(r"\*+|__")
 
 class LLMService:
     def __init__(self):
         self.api_key = config.GEMINI_API_KEY
         self.groq_api_key = config.GROQ_API_KEY
+        self._genai = None
+        self._model = None
+        self._groq_client = None
+        self._init_lock = threading.Lock()
         
-        # Initialize Gemini
         if not self.api_key:
-            logging.warning("GEMINI_API_KEY not found. LLM service might fail if Groq is also missing.")
-        else:
-            genai.configure(api_key=self.api_key)
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
+            logger.warning("GEMINI_API_KEY not found. LLM service might fail if Groq is also missing.")
 
-        # Initialize Groq
         if not self.groq_api_key:
-            logging.warning("GROQ_API_KEY not found. Fallback will not be available.")
-            self.groq_client = None
-        else:
-            self.groq_client = Groq(api_key=self.groq_api_key)
+            logger.warning("GROQ_API_KEY not found. Fallback will not be available.")
+
+        # Identical requests that arrive while one is in flight share its provider call
+        self._in_flight = SingleFlight()
+
+        # Connection warm-up bookkeeping
+        self._last_used = 0.0
+        self._warm_up_lock = threading.Lock()
+        self.metrics = {'warmup_seconds': {}, 'warmups': 0, 'last_warmup': None}
+
+    @property
+    def model(self):
+        """Gemini model, the SDK is imported and configured on first access."""
+        if self._model is None and self.api_key:
+            with self._init_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+                    self._model = genai.GenerativeModel(GEMINI_MODEL)
+        return self._model
+
+    @property
+    def groq_client(self):
+        """Groq client, the SDK is imported on first access."""
+        if self._groq_client is None and self.groq_api_key:
+            with self._init_lock:
+                if self._groq_client is None:
+                    from groq import Groq
+                    self._groq_client = Groq(api_key=self.groq_api_key)
+        return self._groq_client
+
+    def start_warm_up(self):
+        """Warms up the provider connections in a background thread."""
+        threading.Thread(target=self.warm_up, name="llm-warmup", daemon=True).start()
+
+    def warm_up(self):
+        """
+        Imports the SDKs and makes a cheap request to every configured provider so
+        that DNS, TLS and channel setup are done before the first real generation.
+        """
+        if not self._warm_up_lock.acquire(blocking=False):
+            return # Another warm-up is already running
+
+        try:
+            providers = []
+            if self.api_key:
+                providers.append(('gemini', lambda: self.model.count_tokens("ping")))
+            if self.groq_api_key:
+                providers.append(('groq', lambda: self.groq_client.models.list()))
+
+            for name, ping in providers:
+                start = time.perf_counter()
+                try:
+                    ping()
+                except Exception as e:
+                    logger.warning("LLM warm-up for %s failed: %s", name, e)
+                    continue
+                elapsed = time.perf_counter() - start
+                self.metrics['warmup_seconds'][name] = round(elapsed, 3)
+                logger.info("LLM warm-up for %s took %.0f ms", name, elapsed * 1000)
+
+            self.metrics['warmups'] += 1
+            self.metrics['last_warmup'] = time.time()
+            self._last_used = time.monotonic()
+        finally:
+            self._warm_up_lock.release()
 
+    def keep_alive(self):
+        """
+        Meant to be called periodically. Re-warms the connections if no request
+        went out for LLM_KEEPALIVE_IDLE seconds, before they are dropped as idle.
+        """
+        if time.monotonic() - self._last_used >= config.LLM_KEEPALIVE_IDLE:
+            self.warm_up()
+
+    def get_stats(self) -> str:
+        timings = ", ".join(f"{name}: {seconds * 1000:.0f} ms" for name, seconds in self.metrics['warmup_seconds'].items())
+        return f"LLM warm-ups: {self.metrics['warmups']} ({timings or 'none yet'})"
+
+    @tracing.traced("llm.generate_tweet")
     def generate_tweet(self, topic: str, tone: str = "Professional", style_instruction: str = None) -> str:
         """
         Generates a tweet based on the given topic, tone, and optional style instruction.
-        Attempts Gemini first, then falls back to Groq.
-        """
-        prompts = {
-            "Human": (
-                f"You are a real person just sharing a quick thought. "
-                f"Topic: {topic}. "
-                f"Tone: Casual, authentic, lowercase-friendly. "
-                f"Write like you're texting a friend. "
-                f"No cringy hashtags or forced engagement hooks."
-            ),
-            "Professional": (
-                f"You are a thoughtful professional sharing a quick insight. "
-                f"Topic: {topic}. "
-                f"Tone: Accessible, smart but not academic. "
-                f"Share the insight directly. No buzzwords."
-            ),
-            "Funny": (
-                f"You are naturally funny and observant. "
-                f"Topic: {topic}. "
-                f"Tone: Dry, witty, maybe a bit self-deprecating. "
-                f"Just a quick funny observation. No 'dad jokes'."
-            ),
-            "Logical": (
-                f"You are a clear thinker connecting the dots. "
-                f"Topic: {topic}. "
-                f"Tone:  Straightforward and grounded. "
-                f"Point out the logic simply. No fancy words."
-            ),
-            "Technical": (
-                f"You are a dev engaging with peers. "
-                f"Topic: {topic}. "
-                f"Tone: Practical and real. "
-                f"Share the tip or thought directly. "
-            ),
-            "Mathematical": (
-                f"You see the numbers behind things. "
-                f"Topic: {topic}. "
-                f"Tone: Sharp and precise but human. "
-                f"Frame it with a quick stat or probability. Keep it very brief."
-            )
-        }
-        
-        base_prompt = prompts.get(tone, prompts["Professional"])
-        
-        if style_instruction:
-            base_prompt += f" STYLE INSTRUCTION: {style_instruction}"
-        
-        # Simplified Prompt Structure for Brevity and Authenticity
-        prompt = (
-            f"Role: {tone} voice. "
-            f"Topic: {topic} "
-            f"Context: {base_prompt}\n"
-            f"INSTRUCTIONS:\n"
-            f"- MAX LENGTH: 270 characters TOTAL (INLCUDING HASHTAGS). STRICT.\n"
-            f"- KEEP MAIN TEXT UNDER 200 CHARACTERS to leave room for tags.\n"
-            f"- REQUIRED: You MUST add 1-3 relevant hashtags at the end.\n"
-            f"- NO hashtags in the middle of sentences.\n"
-            f"- Be human. No AI buzzwords."
-        )
-        
+        Attempts Gemini first, then falls back to Groq. A failure returns a falsy
+        Refusal, UNAVAILABLE or REJECTED.
+        """
+        # Tones and the instruction block come from the prompt file, compiled once per version
+        prompt = get_registry().current().build_prompt(topic, tone, style_instruction)
+
+        return self._in_flight.do(prompt, self._generate_from_prompt, prompt)
+
+    @tracing.traced("llm.generate_thread")
+    def generate_thread(self, topic: str, tone: str = "Professional", count: int = None) -> list[str]:
+        """
+        Generates a thread of about `count` tweets, numbered "1/n", "2/n"...
+        Returns the tweets, or None if the output can't be turned into a valid thread.
+        Makes at most 1 + THREAD_MAX_REWRITES provider calls.
+        """
+        count = min(max(count or config.THREAD_LENGTH, 2), MAX_THREAD_SEGMENTS)
+        prompt = get_registry().current().build_thread_prompt(topic, tone, count)
+
+        return self._in_flight.do(prompt, self._generate_thread_from_prompt, prompt, topic, tone)
+
+    def _complete(self, prompt: str) -> str:
+        """
+        Runs the provider calls for a fully built prompt: Gemini first, then Groq.
+        Returns the raw text, or None if both failed.
+        """
+        self._last_used = time.monotonic()
         text = None
         try:
             # Try Gemini First
             if self.model:
                 # Remove hard token limit to prevent premature cutoffs; rely on prompt
-                response = self.model.generate_content(
-                    prompt, 
-                    generation_config=genai.types.GenerationConfig(
-                        temperature=0.7 
+                with tracing.span("llm.gemini", model=GEMINI_MODEL):
+                    response = self.model.generate_content(
+                        prompt, 
+                        generation_config=self._genai.types.GenerationConfig(
+                            temperature=0.7 
+                        )
                     )
-                )
                 text = response.text.strip()
             else:
                 raise Exception("Gemini model not initialized")
 
         except Exception as e:
-            logging.warning(f"Gemini generation failed: {e}. Attempting Groq fallback...")
+            logger.warning("Gemini generation failed: %s. Attempting Groq fallback...", e)
             
             # Fallback to Groq
             if self.groq_client:
                 try:
-                    chat_completion = self.groq_client.chat.completions.create(
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": prompt,
-                            }
-                        ],
-                        model="meta-llama/llama-4-scout-17b-16e-instruct", # Use stable model
-                    )
+                    with tracing.span("llm.groq"):
+                        chat_completion = self.groq_client.chat.completions.create(
+                            messages=[
+                                {
+                                    "role": "user",
+                                    "content": prompt,
+                                }
+                            ],
+                            model="meta-llama/llama-4-scout-17b-16e-instruct", # Use stable model
+                        )
                     text = chat_completion.choices[0].message.content.strip()
-                    logging.info("Groq fallback generation successful.")
+                    logger.info("Groq fallback generation successful.")
                 except Exception as groq_e:
-                    logging.error(f"Groq fallback also failed: {groq_e}")
+                    logger.error("Groq fallback also failed: %s", groq_e)
             else:
-                logging.error("Groq fallback unavailable (no API key).")
+                logger.error("Groq fallback unavailable (no API key).")
 
+        return text or None
+
+    def _generate_from_prompt(self, prompt: str) -> str:
+        """
+        Runs the provider calls for a fully built prompt and validates the result.
+        """
+        text = self._complete(prompt)
         
         # If both failed, text is still None or empty
         if not text:
-            return None
+            return Refusal(UNAVAILABLE)
 
-        # Cleanup: Remove surrounding quotes if present and strip markdown asterisks
-        if text.startswith('"') and text.endswith('"'):
-            text = text[1:-1].strip()
-        text = text.replace('*', '')
+        text = clean_text(text)
         
         # Strict Length Check 
-        if len(text) > 280:
-            logging.error(f"Generation Failed: Tweet too long ({len(text)} chars). STRICT LIMIT.")
-            return None
+        if len(text) > MAX_TWEET_LENGTH:
+            logger.error("Generation Failed: Tweet too long (%s chars). STRICT LIMIT.", len(text))
+            return Refusal(REJECTED, f"too long ({len(text)} chars)")
         
         # Validation for other issues
         if self._validate_tweet_content(text):
             return text
         
-        logging.warning(f"Tweet generation rejected: {text}")
-        return None
+        logger.warning("Tweet generation rejected: %s", text)
+        return Refusal(REJECTED, "failed content validation")
+
+    def _generate_thread_from_prompt(self, prompt: str, topic: str, tone: str) -> list[str]:
+        """
+        Splits the model output into numbered tweets and checks all of them. Tweets
+        that fail (too long, forbidden phrase) are rewritten in parallel, each with
+        its own request, instead of regenerating the whole thread. A thread with
+        more than THREAD_MAX_REWRITES failed tweets is rejected.
+        """
+        text = self._complete(prompt)
+        if not text:
+            return None
+
+        segments = split_thread(text)
+        if not 2 <= len(segments) <= MAX_THREAD_SEGMENTS:
+            logger.error("Thread generation failed: got %s tweets.", len(segments))
+            return None
+
+        count = len(segments)
+        limit = MAX_TWEET_LENGTH - len(number_prefix(count, count))
+        failed = [i for i, segment in enumerate(segments) if segment_problem(segment, limit)]
+        if len(failed) > config.THREAD_MAX_REWRITES:
+            logger.warning("Thread generation rejected: %s of %s tweets invalid.", len(failed), count)
+            return None
+        if failed:
+            logger.info("Rewriting %s of %s thread tweets.", len(failed), count)
+            prompts = get_registry().current()
+            with ThreadPoolExecutor(max_workers=min(len(failed), config.THREAD_REPAIR_WORKERS)) as pool:
+                # Worker threads don't inherit the context, so the spans are run in a copy of it
+                futures = {
+                    i: pool.submit(
+                        contextvars.copy_context().run, self._rewrite_segment,
+                        prompts.build_segment_prompt(topic, tone, i + 1, count, limit, segments[i]), limit
+                    )
+                    for i in failed
+                }
+                for i, future in futures.items():
+                    segments[i] = future.result()
+            if not all(segments):
+                logger.warning("Thread generation rejected: some tweets could not be fixed.")
+                return None
+
+        return [number_prefix(i + 1, count) + segment for i, segment in enumerate(segments)]
+
+    def _rewrite_segment(self, prompt: str, limit: int) -> str:
+        with tracing.span("llm.rewrite_segment"):
+            text = self._complete(prompt)
+        if not text:
+            return None
+        text = clean_text(text)
+        problem = segment_problem(text, limit)
+        if problem:
+            logger.warning("Rewritten thread tweet rejected: %s", problem)
+            return None
+        return text
 
     def _validate_tweet_content(self, text: str) -> bool:
         """
@@ -151,16 +285,77 @@ class LLMService:
         """
         if not text:
             return False
-            
-        forbidden_phrases = [
-            "I cannot", "I can't", "I am an AI", "large language model",
-            "Generate a tweet", "Here is a tweet", "Sure!", "Okay,"
-        ]
-        
-        for phrase in forbidden_phrases:
-            if phrase.lower() in text.lower():
-                logging.warning(f"Validation Failed: Contains forbidden phrase '{phrase}'.")
-                return False
+
+        phrase = find_forbidden_phrase(text)
+        if phrase:
+            logger.warning("Validation Failed: Contains forbidden phrase '%s'.", phrase)
+            return False
                 
         return True
 
+
+def clean_text(text: str) -> str:
+    """Removes surrounding quotes and markdown asterisks from model output."""
+    text = text.strip()
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1].strip()
+    return text.replace('*', '')
+
+
+def number_prefix(index: int, count: int) -> str:
+    return f"{index}/{count} "
+
+
+def split_thread(text: str) -> list[str]:
+    """
+    Splits model output into thread tweets. Tweets are expected to start with
+    their number ("1/", or "2." / "3)" if no tweet uses a slash); anything before
+    the first one (e.g. "Here is your thread:") is dropped. Unnumbered output is
+    split on blank lines.
+    """
+    text = EMPHASIS.sub("", text)
+    for marker in (THREAD_MARKER, LIST_MARKER):
+        markers = _numbered(marker.finditer(text))
+        if markers:
+            bounds = [m.start() for m in markers[1:]] + [len(text)]
+            parts = [text[m.end():end] for m, end in zip(markers, bounds)]
+            break
+    else:
+        parts = re.split(r"\n\s*\n", text)
+    # Whitespace is collapsed, line breaks (e.g. of a list in a tweet) are kept
+    segments = [clean_text("\n".join(" ".join(line.split()) for line in part.splitlines() if line.strip())) for part in parts]
+    return [segment for segment in segments if segment]
+
+
+def _numbered(matches) -> list:
+    """The markers that number tweets 1, 2, 3... in order; others are part of the text."""
+    markers = []
+    for m in matches:
+        index, total = int(m['index']), m.groupdict().get('total')
+        if index == len(markers) + 1 and not (total and index > int(total)):
+            markers.append(m)
+    return markers
+
+
+def segment_problem(text: str, limit: int = MAX_TWEET_LENGTH) -> str:
+    """Returns why a thread tweet is invalid, or None."""
+    if not text:
+        return "empty"
+    if len(text) > limit:
+        return f"too long ({len(text)} chars)"
+    phrase = find_forbidden_phrase(text)
+    if phrase:
+        return f"forbidden phrase '{phrase}'"
+    return None
+
+
+def find_forbidden_phrase(text: str) -> str:
+    """
+    Returns the first forbidden phrase (AI disclaimers, prompt echoes...) found in the text, or None.
+    Shared by generation and the bulk draft import.
+    """
+    lowered = text.lower()
+    for phrase in FORBIDDEN_PHRASES:
+        if phrase.lower() in lowered:
+            return phrase
+    return None
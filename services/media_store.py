@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "media_index.json"
+
+# Re-upload a little before X actually expires the media
+MEDIA_ID_SAFETY_MARGIN = 600
+DEFAULT_MEDIA_ID_TTL = 86400
+
+
+class MediaStore:
+    """
+    Content-addressed storage for photos attached to tweets.
+
+    Files are named after the SHA-256 of their content, so the same photo is
+    only stored once no matter how often it is attached. The X `media_id`
+    returned by an upload is remembered per content hash until it expires,
+    and unreferenced files are deleted by `gc` once they are older than the TTL.
+    """
+
+    def __init__(self, directory: str = None, ttl: int = None):
+        self.directory = directory or config.MEDIA_DIR
+        self.ttl = ttl if ttl is not None else config.MEDIA_TTL
+        os.makedirs(self.directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._refs = {}
+        self._telegram_files = {}
+        self._index_path = os.path.join(self.directory, INDEX_FILE)
+        self._index_mtime = None
+        self._media_ids = {}
+        self._refresh_index()
+
+    def _refresh_index(self):
+        """
+        Reloads the media_id index if another process (e.g. a second posting worker)
+        has written it since we last looked.
+        """
+        try:
+            mtime = os.path.getmtime(self._index_path)
+        except OSError:
+            return
+        if mtime == self._index_mtime:
+            return
+        try:
+            with open(self._index_path, 'r') as f:
+                self._media_ids.update(json.load(f))
+            self._index_mtime = mtime
+        except Exception as e:
+            logger.error("Failed to load media index: %s", e)
+
+    def _save_index(self):
+        try:
+            tmp_path = self._index_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._media_ids, f)
+            os.replace(tmp_path, self._index_path)
+            self._index_mtime = os.path.getmtime(self._index_path)
+        except Exception as e:
+            logger.error("Failed to save media index: %s", e)
+
+    @staticmethod
+    def content_key(path: str) -> str:
+        """The content hash a stored file is named after."""
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def lookup_telegram_file(self, file_unique_id: str) -> str:
+        """
+        Returns the stored path of a Telegram file we already downloaded (and takes
+        a reference on it), or None if it has to be downloaded again.
+        """
+        with self._lock:
+            path = self._telegram_files.get(file_unique_id)
+            if path and os.path.exists(path):
+                self._acquire(path)
+                return path
+            self._telegram_files.pop(file_unique_id, None)
+            return None
+
+    def put_bytes(self, data: bytes, suffix: str = ".jpg", file_unique_id: str = None) -> str:
+        """
+        Stores the content (if not already present) and takes a reference on it.
+        Returns the path of the stored file.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self.directory, digest + suffix)
+
+        with self._lock:
+            if not os.path.exists(path):
+                tmp_path = path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            else:
+                logger.debug("Media %s already stored, reusing it.", digest[:12])
+            if file_unique_id:
+                self._telegram_files[file_unique_id] = path
+            self._acquire(path)
+        return path
+
+    def _acquire(self, path):
+        self._refs[path] = self._refs.get(path, 0) + 1
+        # The TTL counts from the last time the file was used
+        os.utime(path, None)
+
+    def release(self, paths):
+        """Drops one reference per path. Files are deleted later by `gc`."""
+        with self._lock:
+            for path in paths or []:
+                count = self._refs.get(path, 0) - 1
+                if count > 0:
+                    self._refs[path] = count
+                else:
+                    self._refs.pop(path, None)
+
+    def get_media_id(self, path: str) -> str:
+        """Returns the cached X media_id for this content, if it is still valid."""
+        with self._lock:
+            self._refresh_index()
+            entry = self._media_ids.get(self.content_key(path))
+            if entry and entry['expires_at'] > time.time():
+                return entry['media_id']
+            return None
+
+    def remember_media_id(self, path: str, media_id: str, expires_after_secs: int = None):
+        ttl = expires_after_secs or DEFAULT_MEDIA_ID_TTL
+        with self._lock:
+            self._refresh_index()
+            self._media_ids[self.content_key(path)] = {
+                'media_id': str(media_id),
+                'expires_at': time.time() + ttl - MEDIA_ID_SAFETY_MARGIN
+            }
+            self._save_index()
+
+    def gc(self) -> int:
+        """
+        Deletes unreferenced files not used within the TTL and forgets expired media_ids.
+        Returns the number of deleted files.
+        """
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name == INDEX_FILE or path in self._refs:
+                    continue
+                try:
+                    if now - os.path.getmtime(path) > self.ttl:
+                        os.remove(path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    logger.error("Media GC failed for %s: %s", path, e)
+
+            self._telegram_files = {k: p for k, p in self._telegram_files.items() if os.path.exists(p)}
+
+            self._refresh_index()
+            expired = [key for key, entry in self._media_ids.items() if entry['expires_at'] <= now]
+            for key in expired:
+                del self._media_ids[key]
+            if expired:
+                self._save_index()
+
+        if removed or expired:
+            logger.info("Media GC: removed %s files, forgot %s expired media IDs.", removed, len(expired))
+        return removed
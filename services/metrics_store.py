@@ -0,0 +1,121 @@
+import time
+import config
+from utils.sqlite import connect
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tweets (
+    tweet_id TEXT PRIMARY KEY,
+    posted_at REAL NOT NULL,
+    source TEXT,
+    theme TEXT,
+    tone TEXT,
+    style TEXT,
+    likes INTEGER,
+    retweets INTEGER,
+    replies INTEGER,
+    quotes INTEGER,
+    bookmarks INTEGER,
+    impressions INTEGER,
+    metrics_updated_at REAL,
+    credited INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tweets_refresh ON tweets (posted_at, metrics_updated_at);
+"""
+
+# Engagement as used for ranking: every public interaction counts once
+ENGAGEMENT_SQL = "COALESCE(likes, 0) + COALESCE(retweets, 0) + COALESCE(replies, 0) + COALESCE(quotes, 0) + COALESCE(bookmarks, 0)"
+
+
+class MetricsStore:
+    """
+    Every tweet we post, with the theme/tone/style it was generated with and
+    its latest public metrics from X.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.METRICS_DB
+        with connect(self.path) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(tweets)")}
+            if 'credited' not in columns:
+                # Databases created before the theme selector existed
+                conn.execute("ALTER TABLE tweets ADD COLUMN credited INTEGER NOT NULL DEFAULT 0")
+
+    def record_post(self, tweet_id: str, metadata: dict = None):
+        metadata = metadata or {}
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO tweets (tweet_id, posted_at, source, theme, tone, style) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(tweet_id), time.time(), metadata.get('source'), metadata.get('theme'),
+                 metadata.get('tone'), metadata.get('style'))
+            )
+
+    def due_for_refresh(self, limit: int, max_age_days: float, refresh_interval: float) -> list[str]:
+        """
+        IDs of tweets younger than `max_age_days` whose metrics are older than
+        `refresh_interval` seconds (or missing), least recently refreshed first.
+        """
+        now = time.time()
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT tweet_id FROM tweets WHERE posted_at >= ? "
+                "AND (metrics_updated_at IS NULL OR metrics_updated_at < ?) "
+                "ORDER BY metrics_updated_at IS NOT NULL, metrics_updated_at, posted_at LIMIT ?",
+                (now - max_age_days * 86400, now - refresh_interval, limit)
+            ).fetchall()
+        return [row['tweet_id'] for row in rows]
+
+    def update_metrics(self, metrics: dict, checked_ids: list[str]):
+        """
+        Stores public metrics ({tweet_id: public_metrics}) and marks every checked ID
+        as refreshed, so deleted tweets aren't requested again right away.
+        """
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "UPDATE tweets SET likes = ?, retweets = ?, replies = ?, quotes = ?, bookmarks = ?, "
+                "impressions = ?, metrics_updated_at = ? WHERE tweet_id = ?",
+                [(m.get('like_count'), m.get('retweet_count'), m.get('reply_count'), m.get('quote_count'),
+                  m.get('bookmark_count'), m.get('impression_count'), now, str(tweet_id))
+                 for tweet_id, m in metrics.items()]
+            )
+            conn.executemany(
+                "UPDATE tweets SET metrics_updated_at = ? WHERE tweet_id = ?",
+                [(now, str(tweet_id)) for tweet_id in checked_ids if str(tweet_id) not in metrics]
+            )
+            conn.execute("COMMIT")
+
+    def aggregates(self, column: str) -> list[dict]:
+        """Per-value stats for 'theme', 'tone' or 'style', best average engagement first."""
+        if column not in ('theme', 'tone', 'style', 'source'):
+            raise ValueError(f"Cannot aggregate by {column}")
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                f"SELECT {column} AS name, COUNT(*) AS posts, "
+                f"AVG({ENGAGEMENT_SQL}) AS avg_engagement, AVG(likes) AS avg_likes, "
+                f"AVG(retweets) AS avg_retweets, AVG(impressions) AS avg_impressions "
+                f"FROM tweets WHERE likes IS NOT NULL AND {column} IS NOT NULL "
+                f"GROUP BY {column} ORDER BY avg_engagement DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def uncredited_engagement(self, min_age_seconds: float, source: str = 'automation', limit: int = 500) -> list[dict]:
+        """
+        Tweets from `source` that are at least `min_age_seconds` old, have metrics
+        and haven't been fed back to the theme selector yet.
+        """
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                f"SELECT tweet_id, theme, style, tone, {ENGAGEMENT_SQL} AS engagement FROM tweets "
+                "WHERE credited = 0 AND source = ? AND likes IS NOT NULL AND posted_at <= ? "
+                "ORDER BY posted_at LIMIT ?",
+                (source, time.time() - min_age_seconds, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def mark_credited(self, tweet_ids: list[str]):
+        if not tweet_ids:
+            return
+        with connect(self.path) as conn:
+            conn.executemany("UPDATE tweets SET credited = 1 WHERE tweet_id = ?", [(str(t),) for t in tweet_ids])
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import string
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+# Bot API limits callback_data to 64 bytes; theme and thread-tone buttons also carry a prefix
+MAX_NAME_LENGTH = 50
+# Callback data of the non-tone buttons on the tone keyboard
+RESERVED_TONE_PREFIXES = ("AB_TEST", "THREAD")
+
+
+class PromptConfigError(ValueError):
+    """Raised when the prompt file is invalid; the previous registry stays active."""
+
+
+class Template:
+    """
+    A str.format-style template parsed once into literal/field pairs, so
+    rendering is a single join without re-parsing the format string.
+    """
+
+    def __init__(self, text: str, allowed_fields: set, name: str):
+        self.text = text
+        self.segments = []
+        try:
+            parsed = list(string.Formatter().parse(text))
+        except ValueError as e:
+            raise PromptConfigError(f"{name}: {e}")
+        for literal, field, format_spec, conversion in parsed:
+            if field is not None:
+                if field not in allowed_fields:
+                    raise PromptConfigError(f"{name}: unknown placeholder '{{{field}}}', allowed: {sorted(allowed_fields)}")
+                if format_spec or conversion:
+                    raise PromptConfigError(f"{name}: format specs are not supported in '{{{field}}}'")
+            self.segments.append((literal, field))
+
+    def render(self, **values) -> str:
+        return "".join(literal + (str(values[field]) if field is not None else "") for literal, field in self.segments)
+
+
+class PromptSet:
+    """One validated, compiled version of the prompt file."""
+
+    def __init__(self, data: dict, version: int):
+        self.version = version
+        if not isinstance(data, dict):
+            raise PromptConfigError("top level must be an object")
+
+        tones = data.get('tones')
+        if not isinstance(tones, list) or not tones:
+            raise PromptConfigError("'tones' must be a non-empty list")
+
+        self.tones = {}
+        self.tone_labels = {}
+        for index, tone in enumerate(tones):
+            name = tone.get('name') if isinstance(tone, dict) else None
+            if not name or not isinstance(tone.get('template'), str):
+                raise PromptConfigError(f"tones[{index}] needs a 'name' and a 'template'")
+            if name in self.tones:
+                raise PromptConfigError(f"duplicate tone '{name}'")
+            if name.startswith(RESERVED_TONE_PREFIXES) or len(name.encode()) > MAX_NAME_LENGTH:
+                raise PromptConfigError(f"invalid tone name '{name}'")
+            self.tones[name] = Template(tone['template'], {'topic'}, f"tone '{name}'")
+            self.tone_labels[name] = tone.get('label') or name
+
+        self.default_tone = data.get('default_tone', next(iter(self.tones)))
+        if self.default_tone not in self.tones:
+            raise PromptConfigError(f"default_tone '{self.default_tone}' is not a defined tone")
+
+        self.ab_tones = tuple(data.get('ab_tones', []))
+        if len(self.ab_tones) != 2 or any(tone not in self.tones for tone in self.ab_tones):
+            raise PromptConfigError("'ab_tones' must name exactly two defined tones")
+
+        templates = {
+            'instructions': {'tone', 'topic', 'context'},
+            'thread_instructions': {'tone', 'topic', 'context', 'count'},
+            'segment_instructions': {'tone', 'topic', 'index', 'count', 'limit', 'segment'},
+        }
+        for key, fields in templates.items():
+            if not isinstance(data.get(key), str):
+                raise PromptConfigError(f"'{key}' must be a string")
+        self.instructions = Template(data['instructions'], templates['instructions'], "instructions")
+        self.thread_instructions = Template(data['thread_instructions'], templates['thread_instructions'], "thread_instructions")
+        self.segment_instructions = Template(data['segment_instructions'], templates['segment_instructions'], "segment_instructions")
+
+        self.styles = tuple(data.get('styles') or ())
+        self.themes = tuple(data.get('themes') or ())
+        if not self.styles or not all(isinstance(s, str) and s for s in self.styles):
+            raise PromptConfigError("'styles' must be a non-empty list of strings")
+        if not self.themes or not all(isinstance(t, str) and t for t in self.themes):
+            raise PromptConfigError("'themes' must be a non-empty list of strings")
+        for theme in self.themes:
+            if len(theme.encode()) > MAX_NAME_LENGTH:
+                raise PromptConfigError(f"theme '{theme}' is too long for a button")
+
+    def _context(self, topic: str, tone: str, style_instruction: str = None) -> str:
+        # Unknown tones fall back to the default tone
+        template = self.tones.get(tone) or self.tones[self.default_tone]
+        context = template.render(topic=topic)
+        if style_instruction:
+            context += f" STYLE INSTRUCTION: {style_instruction}"
+        return context
+
+    def build_prompt(self, topic: str, tone: str, style_instruction: str = None) -> str:
+        """The full prompt for one generation."""
+        return self.instructions.render(tone=tone, topic=topic, context=self._context(topic, tone, style_instruction))
+
+    def build_thread_prompt(self, topic: str, tone: str, count: int) -> str:
+        """The prompt for a thread of `count` numbered tweets."""
+        return self.thread_instructions.render(tone=tone, topic=topic, count=count, context=self._context(topic, tone))
+
+    def build_segment_prompt(self, topic: str, tone: str, index: int, count: int, limit: int, segment: str) -> str:
+        """The prompt to rewrite one thread tweet that failed validation."""
+        return self.segment_instructions.render(tone=tone, topic=topic, index=index, count=count, limit=limit, segment=segment)
+
+
+class PromptRegistry:
+    """
+    Loads tones, styles and themes from the prompt file (PROMPTS_FILE) and
+    reloads them when the file changes, without a restart.
+
+    The file's mtime is checked at most every `check_interval` seconds. A
+    file that fails validation is logged and ignored, the last good version
+    stays active. The first load must succeed.
+    """
+
+    def __init__(self, path: str = None, check_interval: float = 2.0):
+        self.path = path or config.PROMPTS_FILE
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = os.path.getmtime(self.path)
+        self._checked_at = time.monotonic()
+        self._current = self._load(version=1)
+
+    def _load(self, version: int) -> PromptSet:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise PromptConfigError(f"invalid JSON: {e}")
+        return PromptSet(data, version)
+
+    def current(self) -> PromptSet:
+        """The active prompt set, reloaded first if the file changed."""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return self._current
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError as e:
+                logger.error("Prompt file unavailable, keeping current prompts: %s", e)
+                return self._current
+            if mtime != self._mtime:
+                self._mtime = mtime
+                try:
+                    self._current = self._load(self._current.version + 1)
+                    logger.info("Reloaded prompts from %s (version %s).", self.path, self._current.version)
+                except (PromptConfigError, OSError) as e:
+                    logger.error("Ignoring invalid prompt file %s: %s", self.path, e)
+        return self._current
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> PromptRegistry:
+    """The process-wide registry, created on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PromptRegistry()
+    return _registry
@@ -0,0 +1,62 @@
+import random
+
+ARM_SEPARATOR = "|"
+
+# Arms whose evidence has decayed below this are dropped to keep the state small
+MIN_EVIDENCE = 0.01
+
+
+def arm_key(theme: str, style: str, tone: str) -> str:
+    return ARM_SEPARATOR.join((theme, style, tone))
+
+
+def engagement_reward(engagement: float, scale: float) -> float:
+    """Squashes raw engagement into [0, 1): `scale` interactions give a reward of 0.5."""
+    engagement = max(engagement or 0, 0)
+    return engagement / (engagement + scale)
+
+
+class ThemeSelector:
+    """
+    Picks the theme x style x tone combination for Away Mode with discounted
+    Thompson sampling.
+
+    Every arm has a Beta(1 + successes, 1 + failures) posterior. An engagement
+    reward r adds r successes and 1 - r failures; a rejected generation or a
+    post X refused for its content (duplicate, invalid) counts as a full
+    failure. All arms decay by `decay` on every update, so recent results
+    weigh more than old ones. `state` is a plain dict ({arm: [successes, failures]}) owned by the
+    caller, which keeps it in the automation state. Selection and updates
+    are O(arms).
+    """
+
+    def __init__(self, state: dict, rng: random.Random = None, decay: float = 0.98):
+        self.state = state
+        self.rng = rng or random.Random()
+        self.decay = decay
+
+    def select(self, themes: list[str], styles: list[str], tones: list[str]):
+        """Returns the (theme, style, tone) with the highest sampled success rate."""
+        best, best_score = None, -1.0
+        for theme in themes:
+            for style in styles:
+                for tone in tones:
+                    successes, failures = self.state.get(arm_key(theme, style, tone), (0.0, 0.0))
+                    score = self.rng.betavariate(1 + successes, 1 + failures)
+                    if score > best_score:
+                        best, best_score = (theme, style, tone), score
+        return best
+
+    def record(self, theme: str, style: str, tone: str, reward: float):
+        """Feeds back a reward in [0, 1] for one post of this combination."""
+        for key in list(self.state):
+            successes, failures = self.state[key]
+            successes, failures = successes * self.decay, failures * self.decay
+            if successes + failures < MIN_EVIDENCE:
+                del self.state[key]
+            else:
+                self.state[key] = [round(successes, 4), round(failures, 4)]
+
+        key = arm_key(theme, style, tone)
+        successes, failures = self.state.get(key, (0.0, 0.0))
+        self.state[key] = [round(successes + reward, 4), round(failures + 1 - reward, 4)]
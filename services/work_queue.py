@@ -0,0 +1,198 @@
+import json
+import logging
+import time
+import config
+from utils.sqlite import connect
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    chat_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    result TEXT,
+    error TEXT,
+    run_after REAL NOT NULL,
+    locked_by TEXT,
+    locked_until REAL,
+    relayed INTEGER NOT NULL DEFAULT 0,
+    at_most_once INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, run_after);
+CREATE INDEX IF NOT EXISTS jobs_relay ON jobs (relayed, status);
+"""
+
+# Error of an at-most-once job whose worker went silent while running it
+LEASE_EXPIRED_ERROR = "Lease expired while running; not retried, it may have completed"
+
+
+class WorkQueue:
+    """
+    Durable job queue backed by SQLite, shared between the bot and posting workers.
+
+    The bot enqueues jobs (post a tweet, run an automation tick...) and relays
+    finished ones back to the chat; workers claim jobs with a lease, so a job
+    held by a crashed worker becomes claimable again once the lease runs out.
+    Failed jobs are retried with a linear backoff until `max_attempts`.
+
+    Jobs enqueued with `at_most_once=True` (posting) are the exception: after
+    a lease runs out nobody knows whether the work was done, so the job fails
+    with LEASE_EXPIRED_ERROR instead of being run again.
+    Jobs are plain dicts with the payload and result already decoded.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or config.WORK_QUEUE_DB
+        with connect(self.path) as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if 'at_most_once' not in columns:
+                # Queues created before at-most-once jobs existed
+                conn.execute("ALTER TABLE jobs ADD COLUMN at_most_once INTEGER NOT NULL DEFAULT 0")
+
+    @staticmethod
+    def _to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, kind: str, payload: dict, chat_id: int = None, max_attempts: int = 3, unique: bool = False,
+                at_most_once: bool = False) -> int:
+        """
+        Adds a job and returns its ID. With `unique=True` nothing is added if a job
+        of the same kind is still pending or running, and the ID of that job is
+        returned instead, so two workers never run such jobs at the same time.
+        """
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if unique:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE kind = ? AND status IN ('pending', 'running') LIMIT 1", (kind,)
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row['id']
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, chat_id, max_attempts, at_most_once, run_after, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload), chat_id, max_attempts, int(at_most_once), now, now, now)
+            )
+            conn.execute("COMMIT")
+        logger.debug("Enqueued %s job %s", kind, cursor.lastrowid)
+        return cursor.lastrowid
+
+    def claim(self, worker_id: str, lease_seconds: float = None) -> dict:
+        """
+        Takes the oldest runnable job (or one whose lease has expired) and locks it
+        for this worker. Returns None if there is nothing to do.
+        """
+        lease = lease_seconds or config.WORKER_LEASE_SECONDS
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, locked_by = NULL, locked_until = NULL, updated_at = ? "
+                "WHERE status = 'running' AND locked_until < ? AND at_most_once = 1",
+                (LEASE_EXPIRED_ERROR, now, now)
+            ).rowcount
+            if expired:
+                logger.warning("Failed %s at-most-once jobs whose lease expired.", expired)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'pending' AND run_after <= ?) "
+                "OR (status = 'running' AND locked_until < ?) ORDER BY id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, "
+                "locked_until = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + lease, now, row['id'])
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+            conn.execute("COMMIT")
+        return self._to_job(row)
+
+    def update_payload(self, job_id: int, payload: dict, lease_seconds: float = None):
+        """Saves progress of a running job and extends its lease."""
+        lease = lease_seconds or config.WORKER_LEASE_SECONDS
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE jobs SET payload = ?, locked_until = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(payload), now + lease, now, job_id)
+            )
+
+    def complete(self, job_id: int, result: dict = None):
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, locked_by = NULL, locked_until = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (json.dumps(result), now, job_id)
+            )
+
+    def fail(self, job_id: int, error: str, retry_delay: float = 30):
+        """Schedules a retry, or marks the job as failed once it ran out of attempts."""
+        now = time.time()
+        with connect(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row and row['attempts'] < row['max_attempts']:
+                conn.execute(
+                    "UPDATE jobs SET status = 'pending', error = ?, run_after = ?, locked_by = NULL, "
+                    "locked_until = NULL, updated_at = ? WHERE id = ?",
+                    (error, now + retry_delay * row['attempts'], now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, locked_by = NULL, locked_until = NULL, "
+                    "updated_at = ? WHERE id = ?",
+                    (error, now, job_id)
+                )
+            conn.execute("COMMIT")
+
+    def finished_for_relay(self, limit: int = 50) -> list[dict]:
+        """Finished jobs whose outcome hasn't been reported to their chat yet."""
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE relayed = 0 AND status IN ('done', 'failed') "
+                "AND chat_id IS NOT NULL ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def mark_relayed(self, job_ids: list[int]):
+        if not job_ids:
+            return
+        with connect(self.path) as conn:
+            conn.executemany("UPDATE jobs SET relayed = 1 WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+    def purge(self, older_than_seconds: float = 7 * 86400) -> int:
+        """Deletes finished jobs older than the given age. Returns how many were removed."""
+        cutoff = time.time() - older_than_seconds
+        with connect(self.path) as conn:
+            cursor = conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ? "
+                "AND (relayed = 1 OR chat_id IS NULL)",
+                (cutoff,)
+            )
+        return cursor.rowcount
+
+    def get_stats(self) -> str:
+        with connect(self.path) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {row['status']: row['n'] for row in rows}
+        return "Work queue: " + ", ".join(f"{status}: {counts.get(status, 0)}" for status in ('pending', 'running', 'done', 'failed'))
@@ -1,101 +1,267 @@
-import tweepy
 import config
 import logging
 import os
+import threading
+from services.media_store import MediaStore
+from services.image_service import ImageService
+from services.metrics_store import MetricsStore
+from utils import tracing
+from utils.refusal import Refusal
+
+logger = logging.getLogger(__name__)
+
+# Refusal reasons of post_tweet
+DUPLICATE = "duplicate"         # X already has a recent tweet with this text
+INVALID = "invalid"             # X rejected the request itself (400), e.g. the text
+RATE_LIMITED = "rate_limited"
+AUTH = "auth"                   # credentials or app permissions
+ERROR = "error"                 # network, server or anything else
 
 class XService:
-    def __init__(self):
+    def __init__(self, media_store: MediaStore = None, image_service: ImageService = None,
+                 metrics_store: MetricsStore = None):
         self.consumer_key = config.TWITTER_API_KEY
         self.consumer_secret = config.TWITTER_API_SECRET
         self.access_token = config.TWITTER_ACCESS_TOKEN
         self.access_token_secret = config.TWITTER_ACCESS_TOKEN_SECRET
         self.bearer_token = config.TWITTER_BEARER_TOKEN
+        self.media_store = media_store or MediaStore()
+        self.image_service = image_service or ImageService()
+        self.metrics_store = metrics_store or MetricsStore()
         
         if not all([self.consumer_key, self.consumer_secret, self.access_token, self.access_token_secret]):
-             logging.warning("Twitter API credentials missing. X Service will fail.")
-
-        # Initialize Client without Bearer Token to ensure OAuth 1.0a User Context is used for posting
-        self.client = tweepy.Client(
-            consumer_key=self.consumer_key,
-            consumer_secret=self.consumer_secret,
-            access_token=self.access_token,
-            access_token_secret=self.access_token_secret
-        )
+             logger.warning("Twitter API credentials missing. X Service will fail.")
 
-        try:
-            me = self.client.get_me()
-            logging.info(f"X Service Connected as: {me.data.name} (@{me.data.username})")
-        except Exception as e:
-            logging.error(f"X Service Authentication Failed: {e}") 
-            logging.error("Please ensure you have REGENERATED your Access Token/Secret after setting permissions to 'Read and Write'.")
+        self._client = None
+        self._api = None
+        self._connect_lock = threading.Lock()
 
-        # Authenticate v1.1 for media upload
-        auth = tweepy.OAuth1UserHandler(
-            self.consumer_key, self.consumer_secret,
-            self.access_token, self.access_token_secret
-        )
-        self.api = tweepy.API(auth)
+    @property
+    def client(self):
+        if self._api is None:
+            self._connect()
+        return self._client
 
-        try:
-            # Verify credentials and check access level header
-            self.api.verify_credentials()
-            access_level = self.api.last_response.headers.get('x-access-level', 'unknown')
-            logging.info(f"X API Access Level: {access_level.upper()}")
+    @property
+    def api(self):
+        if self._api is None:
+            self._connect()
+        return self._api
+
+    @tracing.traced("x.connect")
+    def _connect(self):
+        """
+        Imports tweepy and sets up the v2 client and v1.1 API on first use,
+        so startup doesn't pay for the import and the credential checks.
+        """
+        with self._connect_lock:
+            if self._api is not None:
+                return
+            import tweepy
+
+            # Initialize Client without Bearer Token to ensure OAuth 1.0a User Context is used for posting
+            client = tweepy.Client(
+                consumer_key=self.consumer_key,
+                consumer_secret=self.consumer_secret,
+                access_token=self.access_token,
+                access_token_secret=self.access_token_secret
+            )
+
+            try:
+                me = client.get_me()
+                logger.info("X Service Connected as: %s (@%s)", me.data.name, me.data.username)
+            except Exception as e:
+                logger.error("X Service Authentication Failed: %s", e) 
+                logger.error("Please ensure you have REGENERATED your Access Token/Secret after setting permissions to 'Read and Write'.")
+
+            # Authenticate v1.1 for media upload
+            auth = tweepy.OAuth1UserHandler(
+                self.consumer_key, self.consumer_secret,
+                self.access_token, self.access_token_secret
+            )
+            api = tweepy.API(auth)
+
+            try:
+                # Verify credentials and check access level header
+                api.verify_credentials()
+                access_level = api.last_response.headers.get('x-access-level', 'unknown')
+                logger.info("X API Access Level: %s", access_level.upper())
             
-            # DEBUG: Log masked token to verify it matches local
-            masked_token = self.access_token[:10] + "..." if self.access_token else "NONE"
-            logging.info(f"Using Access Token (Masked): {masked_token}")
+                # DEBUG: Log masked token to verify it matches local
+                masked_token = self.access_token[:10] + "..." if self.access_token else "NONE"
+                logger.info("Using Access Token (Masked): %s", masked_token)
             
-            if 'write' not in access_level.lower():
-                logging.error("CRITICAL: Your Access Token is READ-ONLY. You MUST regenerate it to get Write permissions.")
-        except Exception as e:
-            logging.warning(f"Could not verify v1.1 credentials (normal for Free Tier if only v2 is allowed?): {e}")
+                if 'write' not in access_level.lower():
+                    logger.error("CRITICAL: Your Access Token is READ-ONLY. You MUST regenerate it to get Write permissions.")
+            except Exception as e:
+                logger.warning("Could not verify v1.1 credentials (normal for Free Tier if only v2 is allowed?): %s", e)
+
+            self._client = client
+            self._api = api
 
-    def post_tweet(self, text: str, media_paths: list[str] = None) -> bool:
+    @tracing.traced("x.post_tweet")
+    def post_tweet(self, text: str, media_paths: list[str] = None, metadata: dict = None):
         """
         Posts a tweet to X, optionally with media.
+        Returns the new tweet's ID on success, otherwise a falsy Refusal whose
+        reason is one of the constants above. The ID is stored with `metadata`
+        (source, theme, tone, style) for engagement tracking.
         """
+        import tweepy
+
         try:
-            key = os.getenv("TWITTER_API_KEY")
-            secret = os.getenv("TWITTER_API_SECRET")
-            token = os.getenv("TWITTER_ACCESS_TOKEN")
-            token_secret = os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
-            
-            # Re-init client to ensure fresh auth (Fixes 403 Forbidden issue)
-            debug_client = tweepy.Client(
-                consumer_key=key,
-                consumer_secret=secret,
-                access_token=token,
-                access_token_secret=token_secret
-            )
+            debug_client = self._posting_client()
             
-            logging.info(f"Attempting to post: {text}")
+            logger.debug("Attempting to post: %s", text)
             
             media_ids = []
             if media_paths:
-                logging.info(f"Uploading {len(media_paths)} images...")
+                # Shrink images first, upload time dominates the send step
+                with tracing.span("x.preprocess_images", count=len(media_paths)):
+                    media_paths = self.image_service.preprocess(media_paths)
+                logger.info("Uploading %s images...", len(media_paths))
                 for path in media_paths:
-                    media = self.api.media_upload(filename=path)
-                    media_ids.append(str(media.media_id))
-                    logging.info(f"Uploaded media ID: {media.media_id}")
+                    media_ids.append(self._upload_media(path))
 
-            response = debug_client.create_tweet(text=text, media_ids=media_ids if media_ids else None)
-            logging.info(f"Tweet posted successfully: {response}")
-            return True
+            with tracing.span("x.create_tweet"):
+                response = debug_client.create_tweet(text=text, media_ids=media_ids if media_ids else None)
+            tweet_id = str(response.data['id'])
+            logger.info("Tweet posted successfully: %s", tweet_id)
         except tweepy.errors.TooManyRequests as e:
-             logging.error(f"Error posting tweet (429 Too Many Requests): {e}")
-             logging.error("LIMIT REACHED: You have hit the X API Free Tier limit (likely 17 posts/24h). Try again later.")
-             return False
+             logger.error("Error posting tweet (429 Too Many Requests): %s", e)
+             logger.error("LIMIT REACHED: You have hit the X API Free Tier limit (likely 17 posts/24h). Try again later.")
+             return Refusal(RATE_LIMITED, str(e))
+        except tweepy.errors.BadRequest as e:
+            logger.error("Error posting tweet (400 Bad Request): %s", e)
+            return Refusal(INVALID, str(e))
+        except tweepy.errors.Unauthorized as e:
+            logger.error("Error posting tweet (401 Unauthorized): %s. Check your API keys and access tokens.", e)
+            return Refusal(AUTH, str(e))
         except tweepy.errors.Forbidden as e:
-            logging.error(f"Error posting tweet (403 Forbidden): {e}")
-            logging.error(f"Full Error Response: {e.response.text if hasattr(e, 'response') else 'No response body'}")
+            logger.error("Error posting tweet (403 Forbidden): %s", e)
+            logger.error("Full Error Response: %s", e.response.text if hasattr(e, 'response') else 'No response body')
             
             if "duplicate content" in str(e).lower() or (hasattr(e, 'response') and "duplicate" in e.response.text.lower()):
-                 logging.error("ERROR REASON: DUPLICATE CONTENT. You cannot post the exact same tweet twice.")
-            else:
-                 logging.error("HINT: Check your X Developer Portal. Ensure 'User authentication settings' are set to 'Read and Write'. "
-                          "ALSO: You must REGENERATE your Access Token and Secret after changing permissions.")
-            return False
+                 logger.error("ERROR REASON: DUPLICATE CONTENT. You cannot post the exact same tweet twice.")
+                 return Refusal(DUPLICATE, str(e))
+            logger.error("HINT: Check your X Developer Portal. Ensure 'User authentication settings' are set to 'Read and Write'. "
+                     "ALSO: You must REGENERATE your Access Token and Secret after changing permissions.")
+            return Refusal(AUTH, str(e))
+        except Exception as e:
+            logger.error("Error posting tweet: %s", e)
+            return Refusal(ERROR, str(e))
+
+        try:
+            self.metrics_store.record_post(tweet_id, metadata)
         except Exception as e:
-            logging.error(f"Error posting tweet: {e}")
-            return False
+            # The tweet is out, losing its metrics is not worth failing the post
+            logger.error("Failed to record posted tweet %s: %s", tweet_id, e)
+        return tweet_id
+
+    @tracing.traced("x.post_thread")
+    def post_thread(self, segments: list[str], media_paths: list[str] = None, metadata: dict = None,
+                    posted_ids: list[str] = None, on_progress=None) -> list[str]:
+        """
+        Posts `segments` as a thread: each tweet replies to the previous one as soon
+        as its ID comes back. Photos go on the first tweet.
+
+        `posted_ids` are the tweets an earlier attempt already posted; posting resumes
+        with the next segment. `on_progress(ids)` is called after every tweet so the
+        caller can persist them before the next one goes out. Returns the IDs of all
+        posted tweets, fewer than len(segments) if posting stopped early.
+        """
+        import tweepy
+
+        posted = list(posted_ids or [])
+        try:
+            # One client for the whole thread
+            client = self._posting_client()
+            media_ids = None
+            if media_paths and not posted:
+                with tracing.span("x.preprocess_images", count=len(media_paths)):
+                    media_paths = self.image_service.preprocess(media_paths)
+                media_ids = [self._upload_media(path) for path in media_paths]
+        except Exception as e:
+            logger.error("Error preparing thread: %s", e)
+            return posted
+
+        for index in range(len(posted), len(segments)):
+            try:
+                with tracing.span("x.create_tweet", segment=index + 1):
+                    response = client.create_tweet(
+                        text=segments[index],
+                        media_ids=media_ids if index == 0 else None,
+                        in_reply_to_tweet_id=posted[-1] if posted else None
+                    )
+            except tweepy.errors.TweepyException as e:
+                logger.error("Thread stopped at tweet %s/%s: %s", index + 1, len(segments), e)
+                break
+
+            posted.append(str(response.data['id']))
+            if on_progress:
+                on_progress(posted)
+            if index == 0:
+                # Engagement is tracked on the first tweet of the thread
+                try:
+                    self.metrics_store.record_post(posted[0], metadata)
+                except Exception as e:
+                    logger.error("Failed to record posted tweet %s: %s", posted[0], e)
+
+        logger.info("Posted %s/%s tweets of thread %s.", len(posted), len(segments), posted[0] if posted else None)
+        return posted
+
+    @tracing.traced("x.collect_metrics")
+    def collect_metrics(self, max_requests: int = None) -> int:
+        """
+        Refreshes public metrics of recent tweets, up to 100 IDs per get_tweets request
+        and at most `max_requests` requests per run to stay within the read budget.
+        Returns the number of tweets checked.
+        """
+        import tweepy
+
+        max_requests = max_requests or config.METRICS_MAX_REQUESTS_PER_RUN
+        checked = 0
+        for _ in range(max_requests):
+            ids = self.metrics_store.due_for_refresh(
+                limit=100, max_age_days=config.METRICS_MAX_AGE_DAYS, refresh_interval=config.METRICS_REFRESH_INTERVAL
+            )
+            if not ids:
+                break
+            try:
+                with tracing.span("x.get_tweets", count=len(ids)):
+                    response = self.client.get_tweets(ids=ids, tweet_fields=["public_metrics"], user_auth=True)
+            except tweepy.errors.TooManyRequests:
+                logger.warning("Metrics collection hit the X rate limit, continuing next run.")
+                break
+
+            metrics = {str(tweet.id): tweet.public_metrics or {} for tweet in (response.data or [])}
+            self.metrics_store.update_metrics(metrics, ids)
+            checked += len(ids)
+            logger.info("Collected metrics for %s/%s tweets in one request.", len(metrics), len(ids))
+        return checked
+
+    def _posting_client(self):
+        import tweepy
+
+        # Re-init client to ensure fresh auth (Fixes 403 Forbidden issue)
+        return tweepy.Client(
+            consumer_key=os.getenv("TWITTER_API_KEY"),
+            consumer_secret=os.getenv("TWITTER_API_SECRET"),
+            access_token=os.getenv("TWITTER_ACCESS_TOKEN"),
+            access_token_secret=os.getenv("TWITTER_ACCESS_TOKEN_SECRET")
+        )
+
+    @tracing.traced("x.upload_media")
+    def _upload_media(self, path: str) -> str:
+        """
+        Uploads an image, reusing the media_id of an earlier upload of the same content.
+        """
+        media_id = self.media_store.get_media_id(path)
+        if media_id:
+            logger.debug("Reusing uploaded media ID: %s", media_id)
+            return media_id
+
+        media = self.api.media_upload(filename=path)
+        self.media_store.remember_media_id(path, media.media_id, getattr(media, 'expires_after_secs', None))
+        logger.info("Uploaded media ID: %s", media.media_id)
+        return str(media.media_id)
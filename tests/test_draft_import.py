@@ -0,0 +1,56 @@
+import pytest
+from services.draft_store import DraftStore
+from utils.draft_import import import_drafts, validate_row
+
+
+def test_valid_row_is_cleaned_up():
+    draft, reason = validate_row({'text': '  Ship it  ', 'date': '2024-05-01 ', 'theme': ' ai ', 'tone': ''})
+    assert reason is None
+    assert draft == {'text': 'Ship it', 'theme': 'ai', 'tone': None, 'scheduled_date': '2024-05-01'}
+
+
+@pytest.mark.parametrize("row, reason", [
+    (None, "unparseable row"),
+    ({'text': 42}, "text is not a string"),
+    ({'text': 'ok', 'date': 20240501}, "date is not a string"),
+    ({'text': '   '}, "empty text"),
+    ({}, "empty text"),
+    ({'text': 'x' * 281}, "too long (281 chars)"),
+    ({'text': 'Sure! here you go'}, "forbidden phrase 'Sure!'"),
+    ({'text': 'ok', 'date': '2024-13-01'}, "invalid date '2024-13-01'"),
+])
+def test_rejected_rows(row, reason):
+    assert validate_row(row) == (None, reason)
+
+
+def test_import_reports_rejections_and_stores_the_rest(tmp_path):
+    path = tmp_path / "drafts.jsonl"
+    path.write_text(
+        '{"Text": "First", "Date": "2024-05-01"}\n'
+        '\n'
+        'not json\n'
+        '["a list"]\n'
+        '{"text": "Second"}\n',
+        encoding='utf-8'
+    )
+    store = DraftStore(str(tmp_path / "drafts.db"))
+
+    summary = import_drafts(str(path), store)
+    assert summary == {
+        'accepted': 2,
+        'rejected': 2,
+        'rejections': ["line 3: unparseable row", "line 4: unparseable row"],
+    }
+    assert store.count_queued() == 2
+    assert store.claim_next('2024-05-01')['text'] == 'First'
+
+
+def test_import_csv_with_mixed_case_headers(tmp_path):
+    path = tmp_path / "drafts.csv"
+    path.write_text("Text, Theme\nHello,ai\n,ai\n", encoding='utf-8')
+    store = DraftStore(str(tmp_path / "drafts.db"))
+
+    summary = import_drafts(str(path), store)
+    assert summary['accepted'] == 1
+    assert summary['rejections'] == ["line 3: empty text"]
+    assert store.claim_next('2024-05-01')['theme'] == 'ai'
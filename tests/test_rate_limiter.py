@@ -0,0 +1,78 @@
+import math
+
+import pytest
+from utils.rate_limiter import RateLimiter, TokenBucket, parse_limit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_up_to_capacity_then_reports_wait():
+    clock = FakeClock()
+    bucket = TokenBucket(3, 30, clock=clock)  # 1 token per 10s
+
+    assert [bucket.try_consume() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_consume() == pytest.approx(10)
+
+    clock.now = 4
+    assert bucket.try_consume() == pytest.approx(6)
+    clock.now = 10
+    assert bucket.try_consume() == 0
+
+
+def test_bucket_refill_is_capped_and_oversized_cost_never_fits():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 10, clock=clock)
+    bucket.try_consume(2)
+    assert not bucket.is_full()
+
+    clock.now = 1000
+    assert bucket.is_full()
+    assert bucket.tokens == 2
+    assert math.isinf(bucket.try_consume(3))
+
+
+def test_parse_limit():
+    assert parse_limit("10/3600") == (10.0, 3600.0)
+
+
+def test_limiter_is_per_user_and_per_action():
+    clock = FakeClock()
+    limiter = RateLimiter({'generate': (2, 60), 'post': (1, 60)}, clock=clock)
+
+    assert limiter.check(1, 'generate') == 0
+    assert limiter.check(1, 'generate') == 0
+    assert limiter.check(1, 'generate') == pytest.approx(30)
+    assert limiter.check(2, 'generate') == 0
+    assert limiter.check(1, 'post') == 0
+
+    assert limiter.remaining(1, 'generate') == 0
+    assert limiter.remaining(2, 'generate') == 1
+    assert limiter.remaining(3, 'generate') == 2
+    assert limiter.counters['generate'] == {'allowed': 3, 'rejected': 1}
+    assert limiter.counters['post'] == {'allowed': 1, 'rejected': 0}
+
+
+def test_limiter_ignores_unknown_actions():
+    limiter = RateLimiter({'generate': (1, 60)}, clock=FakeClock())
+    assert limiter.check(1, 'other') == 0
+    assert 'other' not in limiter.counters
+
+
+def test_limiter_prunes_full_buckets_only(monkeypatch):
+    clock = FakeClock()
+    limiter = RateLimiter({'generate': (2, 60)}, clock=clock)
+    monkeypatch.setattr(limiter, 'PRUNE_THRESHOLD', 2)
+
+    limiter.check(1, 'generate', cost=2)
+    limiter.check(2, 'generate')
+    clock.now = 30  # user 1 is at 1 token, user 2 has refilled
+    limiter.check(3, 'generate')
+
+    assert set(limiter._buckets) == {(1, 'generate'), (3, 'generate')}
+    assert limiter.remaining(1, 'generate') == 1
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+from utils.single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, callers=5):
+    """Starts `callers` threads on the same key while the leader is held inside `fn`."""
+    results, errors = [], []
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    threads, results, errors = _run_concurrently(flight, "k", fn)
+    while flight.shared_calls < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert calls == [1]
+    assert results == ["result"] * 5
+    assert errors == []
+
+
+def test_followers_receive_the_leaders_exception():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ValueError("boom")
+
+    threads, results, errors = _run_concurrently(flight, "k", fn, callers=3)
+    while flight.shared_calls < 2:
+        threading.Event().wait(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert results == []
+    assert len(errors) == 3 and all(isinstance(e, ValueError) for e in errors)
+
+
+def test_key_is_forgotten_after_the_call():
+    flight = SingleFlight()
+    calls = []
+
+    def fn(value):
+        calls.append(value)
+        return value
+
+    assert flight.do("k", fn, 1) == 1
+    assert flight.do("k", fn, 2) == 2
+    assert calls == [1, 2]
+    assert flight.shared_calls == 0
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", fail)
+    assert flight.do("k", fn, 3) == 3
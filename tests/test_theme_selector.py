@@ -0,0 +1,53 @@
+import random
+from collections import Counter
+
+import pytest
+from services.theme_selector import ThemeSelector, arm_key, engagement_reward
+
+
+def test_engagement_reward_is_squashed():
+    assert engagement_reward(0, 10) == 0
+    assert engagement_reward(None, 10) == 0
+    assert engagement_reward(-5, 10) == 0
+    assert engagement_reward(10, 10) == 0.5
+    assert 0.99 < engagement_reward(10_000, 10) < 1
+
+
+def test_record_adds_reward_and_decays_other_arms():
+    state = {}
+    selector = ThemeSelector(state, decay=0.5)
+
+    selector.record("ai", "tip", "dry", 0.75)
+    assert state == {arm_key("ai", "tip", "dry"): [0.75, 0.25]}
+
+    selector.record("web", "tip", "dry", 0.0)
+    assert state[arm_key("ai", "tip", "dry")] == [0.375, 0.125]
+    assert state[arm_key("web", "tip", "dry")] == [0.0, 1.0]
+
+
+def test_record_drops_arms_with_negligible_evidence():
+    state = {arm_key("old", "tip", "dry"): [0.004, 0.004]}
+    ThemeSelector(state, decay=0.9).record("ai", "tip", "dry", 1.0)
+    assert list(state) == [arm_key("ai", "tip", "dry")]
+
+
+def test_select_favours_the_arm_that_earns_rewards():
+    state = {}
+    selector = ThemeSelector(state, rng=random.Random(1))
+    for _ in range(20):
+        selector.record("good", "tip", "dry", 1.0)
+        selector.record("bad", "tip", "dry", 0.0)
+
+    picks = Counter(selector.select(["good", "bad"], ["tip"], ["dry"]) for _ in range(200))
+    assert picks[("good", "tip", "dry")] > 190
+
+
+def test_select_explores_arms_without_history():
+    selector = ThemeSelector({}, rng=random.Random(1))
+    picks = Counter(selector.select(["a", "b", "c"], ["tip"], ["dry"]) for _ in range(300))
+    assert set(picks) == {("a", "tip", "dry"), ("b", "tip", "dry"), ("c", "tip", "dry")}
+
+
+@pytest.mark.parametrize("themes, styles, tones", [([], ["tip"], ["dry"]), (["a"], [], ["dry"])])
+def test_select_without_candidates_returns_none(themes, styles, tones):
+    assert ThemeSelector({}).select(themes, styles, tones) is None
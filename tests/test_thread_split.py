@@ -0,0 +1,37 @@
+import pytest
+from services.llm_service import split_thread
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1/ Hook\n2/ Second", ["Hook", "Second"]),
+    ("1/3 Hook\n2/3 Second\n3/3 Third", ["Hook", "Second", "Third"]),
+    ("(1/2) Hook\n(2/2) Second", ["Hook", "Second"]),
+    ("1/2: Hook\n2/2: Second", ["Hook", "Second"]),
+    ("**1/** Hook\n\n**2/** Second", ["Hook", "Second"]),
+    ("**1/2** Hook\n\n**2/2** Second", ["Hook", "Second"]),
+    ("Here is your thread:\n1/ Hook\n2/ Second", ["Hook", "Second"]),
+])
+def test_slash_markers(text, expected):
+    assert split_thread(text) == expected
+
+
+def test_numbered_list_inside_a_tweet_is_not_split():
+    text = "1/ Reasons:\n1. speed\n2. cost\n\n2/ Done"
+    assert split_thread(text) == ["Reasons:\n1. speed\n2. cost", "Done"]
+
+
+def test_list_markers_without_slash_markers():
+    assert split_thread("1. Hook\n2. Second\n3) Third") == ["Hook", "Second", "Third"]
+
+
+def test_numbers_in_text_are_not_markers():
+    text = "1/ Our service:\n24/7 uptime\n2/ Up 2.5% this week"
+    assert split_thread(text) == ["Our service:\n24/7 uptime", "Up 2.5% this week"]
+
+
+def test_text_starting_with_a_ratio_falls_back_to_blank_lines():
+    assert split_thread("24/7 uptime\n\nSecond") == ["24/7 uptime", "Second"]
+
+
+def test_unnumbered_output_is_split_on_blank_lines():
+    assert split_thread("Hook\n\n  Second   tweet \n\n\n") == ["Hook", "Second tweet"]
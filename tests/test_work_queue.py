@@ -0,0 +1,119 @@
+import sqlite3
+
+import pytest
+from services import work_queue
+from services.work_queue import LEASE_EXPIRED_ERROR, WorkQueue
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(work_queue.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return WorkQueue(str(tmp_path / "jobs.db"))
+
+
+def test_claimed_job_is_leased_to_one_worker(queue):
+    job_id = queue.enqueue('post_tweet', {'text': 'hi'}, chat_id=1)
+
+    job = queue.claim('w1', lease_seconds=60)
+    assert job['id'] == job_id
+    assert job['payload'] == {'text': 'hi'}
+    assert job['status'] == 'running' and job['attempts'] == 1 and job['locked_by'] == 'w1'
+    assert queue.claim('w2', lease_seconds=60) is None
+
+
+def test_expired_lease_makes_the_job_claimable_again(queue, clock):
+    queue.enqueue('generate', {})
+    queue.claim('w1', lease_seconds=60)
+
+    clock.now += 61
+    job = queue.claim('w2', lease_seconds=60)
+    assert job['locked_by'] == 'w2' and job['attempts'] == 2
+
+
+def test_update_payload_extends_the_lease(queue, clock):
+    job_id = queue.enqueue('post_thread', {'posted': []})
+    queue.claim('w1', lease_seconds=60)
+
+    clock.now += 50
+    queue.update_payload(job_id, {'posted': [1]}, lease_seconds=60)
+    clock.now += 50
+    assert queue.claim('w2', lease_seconds=60) is None
+
+
+def test_at_most_once_job_fails_instead_of_rerunning(queue, clock):
+    post_id = queue.enqueue('post_tweet', {}, chat_id=1, at_most_once=True)
+    other_id = queue.enqueue('generate', {}, chat_id=1)
+    queue.claim('w1', lease_seconds=60)
+    queue.claim('w1', lease_seconds=60)
+
+    clock.now += 61
+    job = queue.claim('w2', lease_seconds=60)
+    assert job['id'] == other_id
+
+    failed = {job['id']: job for job in queue.finished_for_relay()}
+    assert failed[post_id]['status'] == 'failed'
+    assert failed[post_id]['error'] == LEASE_EXPIRED_ERROR
+
+
+def test_failed_job_is_retried_with_backoff_then_gives_up(queue, clock):
+    job_id = queue.enqueue('generate', {}, chat_id=1, max_attempts=2)
+
+    queue.claim('w1')
+    queue.fail(job_id, 'timeout', retry_delay=30)
+    assert queue.claim('w1') is None
+    clock.now += 30
+    assert queue.claim('w1')['attempts'] == 2
+
+    queue.fail(job_id, 'timeout again', retry_delay=30)
+    clock.now += 3600
+    assert queue.claim('w1') is None
+    [job] = queue.finished_for_relay()
+    assert job['status'] == 'failed' and job['error'] == 'timeout again'
+
+
+def test_complete_and_relay(queue):
+    job_id = queue.enqueue('generate', {}, chat_id=1)
+    queue.enqueue('automation_tick', {})
+    queue.claim('w1')
+    queue.complete(job_id, {'text': 'done'})
+
+    [job] = queue.finished_for_relay()
+    assert job['result'] == {'text': 'done'}
+    queue.mark_relayed([job_id])
+    assert queue.finished_for_relay() == []
+
+
+def test_unique_enqueue_reuses_pending_or_running_job(queue):
+    first = queue.enqueue('automation_tick', {}, unique=True)
+    assert queue.enqueue('automation_tick', {}, unique=True) == first
+
+    queue.claim('w1')
+    assert queue.enqueue('automation_tick', {}, unique=True) == first
+
+    queue.complete(first)
+    assert queue.enqueue('automation_tick', {}, unique=True) != first
+
+
+def test_old_queue_gains_the_at_most_once_column(tmp_path, clock):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(work_queue.SCHEMA.replace("    at_most_once INTEGER NOT NULL DEFAULT 0,\n", ""))
+    conn.close()
+
+    queue = WorkQueue(path)
+    queue.enqueue('post_tweet', {}, at_most_once=True)
+    assert queue.claim('w1')['at_most_once'] == 1
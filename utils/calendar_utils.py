@@ -1,31 +1,41 @@
 import calendar
 import datetime
+import functools
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 CALENDAR_CALLBACK = "CAL_"
+# Header and padding buttons; answered so the client stops its loading spinner
+IGNORE_CALLBACK = f"{CALENDAR_CALLBACK}IGNORE"
+# Shown below a complete range
+CONFIRM_CALLBACK = f"{CALENDAR_CALLBACK}CONFIRM"
 
-def create_calendar(year=None, month=None):
+def create_calendar(year=None, month=None, start=None, end=None):
     """
     Creates an inline keyboard with the provided year and month.
+    `start` and `end` (datetime.date) highlight a selected range: both ends are
+    bracketed and the days in between are marked. A complete range also gets a
+    Confirm button (CONFIRM_CALLBACK).
     """
     now = datetime.datetime.now()
     if year is None: year = now.year
     if month is None: month = now.month
-    
+    return _month_keyboard(year, month, start, end)
+
+@functools.lru_cache(maxsize=128)
+def _month_keyboard(year, month, start, end):
+    # Keyboards are immutable, so one instance per (month, selection) is shared
+    # between users and reused on every PREV/NEXT tap.
     markup = []
     
     # First row - Month and Year
     row = [
-        InlineKeyboardButton(calendar.month_name[month] + " " + str(year), callback_data="IGNORE")
+        InlineKeyboardButton(calendar.month_name[month] + " " + str(year), callback_data=IGNORE_CALLBACK)
     ]
     markup.append(row)
     
-    # Second row - Week Days (Su Mo Tu ...)
-    days = ["Su", "Mo", "Tu", "We", "Th", "Fr", "Sa"] # US Convention matches calendar.monthcalendar? No, calendar uses 0=Mo
-    # Correcting for calendar module (0=Monday) to match typical US/Global expectation or just stick to ISO.
-    # Let's stick to simple text.
+    # Second row - Week Days (calendar module weeks start on Monday)
     days = ["Mo", "Tu", "We", "Th", "Fr", "Sa", "Su"]
-    row = [InlineKeyboardButton(day, callback_data="IGNORE") for day in days]
+    row = [InlineKeyboardButton(day, callback_data=IGNORE_CALLBACK) for day in days]
     markup.append(row)
     
     # Calendar rows - Days of Month
@@ -34,11 +44,11 @@ def create_calendar(year=None, month=None):
         row = []
         for day in week:
             if day == 0:
-                row.append(InlineKeyboardButton(" ", callback_data="IGNORE"))
+                row.append(InlineKeyboardButton(" ", callback_data=IGNORE_CALLBACK))
             else:
                 # Format: CAL_action_year_month_day
                 # Action: DAY
-                row.append(InlineKeyboardButton(str(day), callback_data=f"{CALENDAR_CALLBACK}DAY_{year}_{month}_{day}"))
+                row.append(InlineKeyboardButton(_day_label(datetime.date(year, month, day), start, end), callback_data=f"{CALENDAR_CALLBACK}DAY_{year}_{month}_{day}"))
         markup.append(row)
         
     # Last row - Previous / Next Month buttons
@@ -53,7 +63,7 @@ def create_calendar(year=None, month=None):
     row.append(InlineKeyboardButton("<<", callback_data=f"{CALENDAR_CALLBACK}PREV_{prev_year}_{prev_month}"))
     
     # Ignore center
-    row.append(InlineKeyboardButton(" ", callback_data="IGNORE"))
+    row.append(InlineKeyboardButton(" ", callback_data=IGNORE_CALLBACK))
     
     # Next Month
     next_month = month + 1
@@ -64,14 +74,26 @@ def create_calendar(year=None, month=None):
     row.append(InlineKeyboardButton(">>", callback_data=f"{CALENDAR_CALLBACK}NEXT_{next_year}_{next_month}"))
     
     markup.append(row)
+
+    if start and end:
+        markup.append([InlineKeyboardButton(f"✅ Confirm {start:%b %d} - {end:%b %d}", callback_data=CONFIRM_CALLBACK)])
     
     return InlineKeyboardMarkup(markup)
 
-def process_calendar_selection(update, context):
+def _day_label(date, start, end):
+    if date == start or date == end:
+        return f"[{date.day}]"
+    if start and end and start < date < end:
+        return f"·{date.day}·"
+    return str(date.day)
+
+async def process_calendar_selection(update, context, start=None, end=None):
     """
     Process the callback query.
     Returns (ret_data, success Boolean)
     ret_data is a date string 'YYYY-MM-DD' if success is True.
+    Month navigation edits the keyboard in place and keeps the `start`/`end` highlight.
+    CONFIRM_CALLBACK is left to the caller.
     """
     query = update.callback_query
     data = query.data
@@ -80,20 +102,20 @@ def process_calendar_selection(update, context):
     _, action, *args = data.split("_")
     
     if action == "IGNORE":
-        query.answer()
+        await query.answer()
         return None, False
         
     elif action == "DAY":
         year, month, day = map(int, args)
         selected_date = datetime.date(year, month, day)
-        query.answer()
+        await query.answer()
         return selected_date.strftime("%Y-%m-%d"), True
         
     elif action == "PREV" or action == "NEXT":
         year, month = map(int, args)
-        new_keyboard = create_calendar(year, month)
-        query.edit_message_reply_markup(reply_markup=new_keyboard)
-        query.answer() # Just nav, no selection
+        new_keyboard = create_calendar(year, month, start, end)
+        await query.answer() # Just nav, no selection
+        await query.edit_message_reply_markup(reply_markup=new_keyboard)
         return None, False
 
     return None, False
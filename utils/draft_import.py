@@ -0,0 +1,111 @@
+import csv
+import datetime
+import itertools
+import json
+import logging
+import os
+from services.llm_service import MAX_TWEET_LENGTH, find_forbidden_phrase
+
+logger = logging.getLogger(__name__)
+
+# Only this many rejected rows are reported back in detail
+MAX_REJECTION_SAMPLES = 10
+# Drafts per insert transaction
+BATCH_SIZE = 500
+# Fields read from a row; JSONL values of any other type than string are rejected
+FIELDS = ('text', 'date', 'theme', 'tone')
+
+
+def iter_rows(path: str):
+    """
+    Streams the rows of a CSV or JSONL file as (line_number, row) pairs, one at a time.
+    CSV files need a header with a 'text' column; 'theme', 'tone' and 'date' are optional.
+    A row that cannot be parsed is yielded as (line_number, None).
+    """
+    if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson", ".json"):
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_number, _normalize_keys(row) if isinstance(row, dict) else None
+    else:
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, _normalize_keys(row)
+
+
+def _normalize_keys(row: dict) -> dict:
+    # Headers and JSON keys match case-insensitively, e.g. 'Text' or ' date'
+    return {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def validate_row(row: dict):
+    """Returns (draft, None) for a valid row or (None, reason) for a rejected one."""
+    if row is None:
+        return None, "unparseable row"
+    for field in FIELDS:
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return None, f"{field} is not a string"
+
+    text = (row.get('text') or "").strip()
+    if not text:
+        return None, "empty text"
+    if len(text) > MAX_TWEET_LENGTH:
+        return None, f"too long ({len(text)} chars)"
+
+    phrase = find_forbidden_phrase(text)
+    if phrase:
+        return None, f"forbidden phrase '{phrase}'"
+
+    scheduled_date = (row.get('date') or "").strip() or None
+    if scheduled_date:
+        try:
+            datetime.datetime.strptime(scheduled_date, "%Y-%m-%d")
+        except ValueError:
+            return None, f"invalid date '{scheduled_date}'"
+
+    return {
+        'text': text,
+        'theme': (row.get('theme') or "").strip() or None,
+        'tone': (row.get('tone') or "").strip() or None,
+        'scheduled_date': scheduled_date,
+    }, None
+
+
+def import_drafts(path: str, draft_store) -> dict:
+    """
+    Validates every row of the file and stores the accepted ones as drafts.
+    Memory use is bounded: rows are streamed from disk and inserted in batches.
+    If the file turns out to be malformed midway, the batches stored so far
+    are kept and 'accepted' counts only those.
+    """
+    summary = {'accepted': 0, 'rejected': 0, 'rejections': []}
+
+    def accepted_drafts():
+        for line_number, row in iter_rows(path):
+            draft, reason = validate_row(row)
+            if draft:
+                yield draft
+            else:
+                summary['rejected'] += 1
+                if len(summary['rejections']) < MAX_REJECTION_SAMPLES:
+                    summary['rejections'].append(f"line {line_number}: {reason}")
+
+    drafts = accepted_drafts()
+    try:
+        while True:
+            batch = list(itertools.islice(drafts, BATCH_SIZE))
+            if not batch:
+                break
+            summary['accepted'] += draft_store.add_many(batch, batch_size=BATCH_SIZE)
+    except (csv.Error, UnicodeDecodeError) as e:
+        logger.error("Draft import of %s aborted: %s", path, e)
+        summary['error'] = str(e)
+
+    logger.info("Draft import finished: %s accepted, %s rejected.", summary['accepted'], summary['rejected'])
+    return summary
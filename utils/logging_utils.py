@@ -0,0 +1,120 @@
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from utils import tracing
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and is kept as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps only a share of DEBUG records per logger, e.g. {'services.work_queue': 0.1}.
+    The most specific configured logger name wins; other levels always pass.
+    """
+
+    def __init__(self, rates: dict, rng: random.Random = None):
+        super().__init__()
+        self.rates = rates
+        self.rng = rng or random.Random()
+
+    def _rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return self.rates.get('', 1.0)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or self.rng.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread untouched. The stock QueueHandler
+    formats the message and traceback in prepare(), on the caller's thread;
+    here that work happens in the listener. The queue never leaves the
+    process, so the record doesn't need to be pickled. Only the trace ID is
+    captured here, it lives in the caller's context.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        trace_id = tracing.current_trace_id()
+        if trace_id:
+            record.trace_id = trace_id
+        return record
+
+
+def parse_sampling(spec: str) -> dict:
+    """Parses 'services.work_queue=0.1,services.x_service=0.5' into a rate per logger name."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", log_file: str = None, debug_sampling: str = None,
+                  text_format: str = TEXT_FORMAT):
+    """
+    Routes all logging through an in-memory queue: log calls only enqueue the
+    record, and a background QueueListener formats it and writes it to stderr
+    (and `log_file`). Returns the listener, which is stopped and flushed at exit.
+    """
+    formatter = JsonFormatter() if fmt == "json" else logging.Formatter(text_format)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    rates = parse_sampling(debug_sampling)
+    if rates:
+        # Filtered before enqueueing, so dropped records cost nothing downstream
+        queue_handler.addFilter(DebugSampler(rates))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener: logging.handlers.QueueListener):
+    """Flushes the queue and stops the listener; safe to call more than once."""
+    if listener._thread is not None:
+        listener.stop()
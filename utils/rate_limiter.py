@@ -0,0 +1,109 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to `capacity` tokens and refills at
+    `capacity / period` tokens per second.
+    """
+
+    def __init__(self, capacity: float, period: float, clock=time.monotonic):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / float(period)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_consume(self, cost: float = 1) -> float:
+        """
+        Takes `cost` tokens if available.
+        Returns 0 on success, otherwise the seconds until enough tokens are back.
+        """
+        self._refill()
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if cost > self.capacity:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def is_full(self) -> bool:
+        self._refill()
+        return self.tokens >= self.capacity
+
+
+def parse_limit(spec: str):
+    """
+    Parses a 'capacity/seconds' spec (e.g. '10/3600') into a (capacity, period) tuple.
+    """
+    capacity, period = spec.split("/")
+    return float(capacity), float(period)
+
+
+class RateLimiter:
+    """
+    Per-user token buckets for a fixed set of actions (generate, regenerate, post...).
+    Keeps allowed/rejected counters per action for monitoring.
+    """
+
+    # Buckets that have refilled completely are dropped once we track this many
+    PRUNE_THRESHOLD = 1000
+
+    def __init__(self, limits: dict, clock=time.monotonic):
+        self.limits = limits
+        self.clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.counters = {action: {'allowed': 0, 'rejected': 0} for action in limits}
+
+    def check(self, user_id, action: str, cost: float = 1) -> float:
+        """
+        Consumes `cost` tokens from the user's bucket for `action`.
+        Returns 0 if the call is allowed, otherwise the seconds to wait.
+        """
+        if action not in self.limits:
+            return 0.0
+
+        with self._lock:
+            key = (user_id, action)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                capacity, period = self.limits[action]
+                bucket = TokenBucket(capacity, period, clock=self.clock)
+                self._buckets[key] = bucket
+
+            retry_after = bucket.try_consume(cost)
+            self.counters[action]['rejected' if retry_after else 'allowed'] += 1
+
+            if len(self._buckets) > self.PRUNE_THRESHOLD:
+                self._prune()
+            return retry_after
+
+    def _prune(self):
+        # A full bucket is indistinguishable from a fresh one, so it is safe to forget
+        for key in [k for k, b in self._buckets.items() if b.is_full()]:
+            del self._buckets[key]
+
+    def remaining(self, user_id, action: str) -> int:
+        with self._lock:
+            bucket = self._buckets.get((user_id, action))
+            if bucket is None:
+                return int(self.limits[action][0])
+            bucket._refill()
+            return int(bucket.tokens)
+
+    def get_stats(self) -> str:
+        lines = []
+        for action, counts in self.counters.items():
+            capacity, period = self.limits[action]
+            lines.append(
+                f"{action}: {counts['allowed']} allowed, {counts['rejected']} rejected "
+                f"(limit {int(capacity)}/{int(period)}s per user)"
+            )
+        return "\n".join(lines)
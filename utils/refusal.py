@@ -0,0 +1,20 @@
+class Refusal:
+    """
+    Falsy stand-in for a result that was refused, carrying the reason.
+
+    Returned where a function used to return None/False on failure: callers
+    that only test the result's truthiness keep working, callers that care
+    why it failed read `reason`.
+    """
+
+    __slots__ = ('reason', 'detail')
+
+    def __init__(self, reason: str, detail: str = ""):
+        self.reason = reason
+        self.detail = detail
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"Refusal({self.reason!r})"
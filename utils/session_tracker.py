@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+
+
+class SessionTracker:
+    """
+    Tracks when each user was last active, in least-recently-used order.
+
+    `touch` reports users pushed out by the `max_sessions` cap and `expired`
+    reports users idle for longer than `idle_timeout` seconds. The caller is
+    responsible for actually dropping their data.
+    """
+
+    def __init__(self, idle_timeout: float, max_sessions: int, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._last_seen = OrderedDict()
+        self.evicted_count = 0
+
+    def touch(self, user_id) -> list:
+        """Marks the user as active. Returns the users evicted to stay under the cap."""
+        self._last_seen[user_id] = self.clock()
+        self._last_seen.move_to_end(user_id)
+
+        evicted = []
+        while len(self._last_seen) > self.max_sessions:
+            old_user, _ = self._last_seen.popitem(last=False)
+            evicted.append(old_user)
+        self.evicted_count += len(evicted)
+        return evicted
+
+    def expired(self) -> list:
+        """Removes and returns every user idle for longer than the timeout."""
+        deadline = self.clock() - self.idle_timeout
+        expired = []
+        # Oldest entries come first, so we can stop at the first fresh one
+        while self._last_seen:
+            user_id, last_seen = next(iter(self._last_seen.items()))
+            if last_seen > deadline:
+                break
+            self._last_seen.popitem(last=False)
+            expired.append(user_id)
+        self.evicted_count += len(expired)
+        return expired
+
+    def forget(self, user_id):
+        self._last_seen.pop(user_id, None)
+
+    def __len__(self):
+        return len(self._last_seen)
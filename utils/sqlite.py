@@ -0,0 +1,19 @@
+import contextlib
+import sqlite3
+
+
+@contextlib.contextmanager
+def connect(path: str):
+    """
+    A short-lived autocommit connection to the SQLite database at `path`, with
+    rows as sqlite3.Row. One per operation keeps the stores safe across threads
+    and processes; transactions are opened explicitly with BEGIN. Closing the
+    connection rolls back any transaction left open by an exception.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        yield conn
+    finally:
+        conn.close()
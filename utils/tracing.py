@@ -0,0 +1,366 @@
+"""
+Lightweight tracing for "why was that slow?" questions.
+
+Every Telegram update (and every worker job) runs inside a trace; handlers and
+LLM/X service calls open spans in it. Finished traces are written by a
+background thread to TRACE_FILE, either one JSON object per span
+(TRACE_FORMAT=json) or one OTLP/JSON ExportTraceServiceRequest per trace
+(TRACE_FORMAT=otlp, the format of the OpenTelemetry collector's file
+exporter). Without TRACE_FILE all of this is a no-op.
+
+With TRACE_PROFILE_SLOWEST=N a sampling profiler also runs: it records the
+stacks of all threads every TRACE_PROFILE_INTERVAL seconds, charges them to
+the trace running on that thread, and keeps collapsed stacks (flamegraph.pl /
+speedscope input) of the N slowest traces in TRACE_PROFILE_DIR.
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import heapq
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# Bounds the profile of a single trace; deeper stacks are cut at the root
+MAX_STACK_DEPTH = 64
+MAX_STACKS_PER_TRACE = 5000
+
+# inspect.CO_COROUTINE; inspect itself takes longer to import than the rest of this module
+CO_COROUTINE = 0x80
+
+
+class Trace:
+    __slots__ = ('trace_id', 'spans', 'stacks', 'lock', 'done')
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+        self.done = False
+        self.stacks = collections.Counter()
+        self.lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start_ns', 'end_ns', 'error')
+
+    def __init__(self, trace: Trace, name: str, parent_id: str = None, attributes: dict = None):
+        self.trace = trace
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.format = "json"
+        self.profiler = None
+        self._queue = None
+
+    def configure(self, path: str = None, fmt: str = "json", profile_slowest: int = 0,
+                  profile_interval: float = 0.005, profile_dir: str = "profiles"):
+        """Enables tracing to `path`; call once at startup, before the first update."""
+        if not path or self.enabled:
+            return
+        self.format = fmt
+        self._queue = queue.SimpleQueue()
+        threading.Thread(target=self._write_loop, args=(path,), name="trace-writer", daemon=True).start()
+        if profile_slowest > 0:
+            self.profiler = SamplingProfiler(profile_slowest, profile_interval, profile_dir)
+            self.profiler.start()
+        self.enabled = True
+        logger.info("Tracing to %s (%s)%s", path, fmt, f", profiling the {profile_slowest} slowest traces" if self.profiler else "")
+
+    @contextlib.contextmanager
+    def start_trace(self, name: str, parent: str = None, **attributes):
+        """
+        Runs the block as the root span of a new trace. `parent` is a
+        "trace_id-span_id" string from current_parent(), to continue a trace
+        started elsewhere (e.g. the update that enqueued a worker job).
+        """
+        if not self.enabled:
+            yield None
+            return
+
+        trace_id, _, parent_id = (parent or "").partition("-")
+        trace = Trace(trace_id or f"{random.getrandbits(128):032x}")
+        root = Span(trace, name, parent_id or None, attributes)
+        token = _current_span.set(root)
+        if self.profiler:
+            self.profiler.enter(trace)
+        try:
+            yield root
+        except BaseException as e:
+            root.error = repr(e)
+            raise
+        finally:
+            root.end_ns = time.time_ns()
+            _current_span.reset(token)
+            if self.profiler:
+                self.profiler.exit(trace)
+            with trace.lock:
+                trace.spans.append(root)
+                spans, trace.spans = trace.spans, []
+                trace.done = True
+            self._queue.put(spans)
+            if self.profiler:
+                self.profiler.finish(trace, root)
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        """A child span of the current one; a no-op outside of a trace."""
+        parent = _current_span.get() if self.enabled else None
+        if parent is None:
+            yield None
+            return
+
+        span = Span(parent.trace, name, parent.span_id, attributes)
+        token = _current_span.set(span)
+        if self.profiler:
+            self.profiler.enter(span.trace)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            if self.profiler:
+                self.profiler.exit(span.trace)
+            with span.trace.lock:
+                if span.trace.done:
+                    # Outlived its trace (e.g. a background task), export it on its own
+                    self._queue.put([span])
+                else:
+                    span.trace.spans.append(span)
+
+    def _write_loop(self, path: str):
+        with open(path, 'a', encoding='utf-8') as f:
+            while True:
+                spans = self._queue.get()
+                try:
+                    if self.format == "otlp":
+                        lines = [json.dumps(_to_otlp(spans), default=str)]
+                    else:
+                        lines = [json.dumps(_to_json(span), default=str) for span in spans]
+                    # One append per trace keeps lines whole when several worker processes share the file
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+                except (OSError, ValueError) as e:
+                    logger.error("Failed to write trace spans: %s", e)
+
+
+def _to_json(span: Span) -> dict:
+    entry = {
+        'trace_id': span.trace.trace_id,
+        'span_id': span.span_id,
+        'parent_id': span.parent_id,
+        'name': span.name,
+        'start': span.start_ns / 1e9,
+        'duration_ms': round(span.duration_ms, 3),
+        'attributes': span.attributes,
+    }
+    if span.error:
+        entry['error'] = span.error
+    return entry
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _to_otlp(spans: list[Span]) -> dict:
+    otlp_spans = []
+    for span in spans:
+        entry = {
+            'traceId': span.trace.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,
+            'startTimeUnixNano': str(span.start_ns),
+            'endTimeUnixNano': str(span.end_ns),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span.attributes.items()],
+            'status': {'code': 2, 'message': span.error} if span.error else {},
+        }
+        if span.parent_id:
+            entry['parentSpanId'] = span.parent_id
+        otlp_spans.append(entry)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'xautomation'}}]},
+        'scopeSpans': [{'scope': {'name': 'utils.tracing'}, 'spans': otlp_spans}],
+    }]}
+
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack with sys._current_frames() and charges it to
+    the trace that thread is working on.
+
+    Worker threads (asyncio.to_thread, executors) are mapped while they are
+    inside a span. On the event loop thread the running task decides; this
+    relies on asyncio.tasks._current_tasks and those samples are skipped on
+    Pythons without it.
+    """
+
+    def __init__(self, slowest: int, interval: float, directory: str):
+        # Only needed when profiling, asyncio is slow to import for the worker processes
+        import asyncio
+        self._asyncio = asyncio
+        self.slowest = slowest
+        self.interval = interval
+        self.directory = directory
+        self._threads = {}      # thread id -> [trace, ...] for threads outside an event loop
+        self._tasks = {}        # asyncio task -> trace
+        self._loops = {}        # event loop thread id -> loop
+        self._slowest = []      # min-heap of (duration_ms, trace_id, path)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._sample_loop, name="trace-profiler", daemon=True).start()
+
+    def enter(self, trace: Trace):
+        loop = self._asyncio._get_running_loop()
+        if loop is not None:
+            task = self._asyncio.current_task(loop)
+            if task is not None and task not in self._tasks:
+                self._tasks[task] = trace
+                self._loops[threading.get_ident()] = loop
+                task.add_done_callback(self._tasks.pop)
+        else:
+            self._threads.setdefault(threading.get_ident(), []).append(trace)
+
+    def exit(self, trace: Trace):
+        if self._asyncio._get_running_loop() is None:
+            stack = self._threads.get(threading.get_ident())
+            if stack:
+                stack.pop()
+
+    def _trace_on(self, thread_id: int, current_tasks: dict):
+        loop = self._loops.get(thread_id)
+        if loop is not None:
+            return self._tasks.get(current_tasks.get(loop))
+        try:
+            return self._threads[thread_id][-1]
+        except (KeyError, IndexError):
+            # Not in a span, or it just ended
+            return None
+
+    def _sample_loop(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            current_tasks = getattr(self._asyncio.tasks, '_current_tasks', {})
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                trace = self._trace_on(thread_id, current_tasks)
+                if trace is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                if key in trace.stacks or len(trace.stacks) < MAX_STACKS_PER_TRACE:
+                    trace.stacks[key] += 1
+
+    def finish(self, trace: Trace, root: Span):
+        """Keeps the collapsed stacks of `trace` on disk if it is among the slowest seen."""
+        if not trace.stacks:
+            return
+        duration = root.duration_ms
+        with self._lock:
+            if len(self._slowest) >= self.slowest and duration <= self._slowest[0][0]:
+                return
+            path = os.path.join(self.directory, f"{int(duration)}ms_{root.name}_{trace.trace_id}.folded")
+            try:
+                with open(path, 'w', encoding='utf-8') as f:
+                    # A plain dict copy is atomic, the sampler may still be adding to the trace
+                    f.writelines(f"{stack} {count}\n" for stack, count in dict(trace.stacks).items())
+            except OSError as e:
+                logger.error("Failed to write profile %s: %s", path, e)
+                return
+            entry = (duration, trace.trace_id, path)
+            if len(self._slowest) < self.slowest:
+                heapq.heappush(self._slowest, entry)
+            else:
+                evicted = heapq.heapreplace(self._slowest, entry)
+                with contextlib.suppress(OSError):
+                    os.remove(evicted[2])
+
+
+tracer = Tracer()
+
+
+def configure_from_config():
+    tracer.configure(config.TRACE_FILE, config.TRACE_FORMAT, config.TRACE_PROFILE_SLOWEST,
+                     config.TRACE_PROFILE_INTERVAL, config.TRACE_PROFILE_DIR)
+
+
+def start_trace(name: str, parent: str = None, **attributes):
+    return tracer.start_trace(name, parent, **attributes)
+
+
+def span(name: str, **attributes):
+    return tracer.span(name, **attributes)
+
+
+def current_trace_id() -> str:
+    current = _current_span.get()
+    return current.trace.trace_id if current else None
+
+
+def current_parent() -> str:
+    """The current position as "trace_id-span_id", to hand to start_trace() in another process."""
+    current = _current_span.get()
+    return f"{current.trace.trace_id}-{current.span_id}" if current else None
+
+
+def traced(name: str = None):
+    """Decorator that runs a sync or async function inside a span (named after it by default)."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+        if func.__code__.co_flags & CO_COROUTINE:
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
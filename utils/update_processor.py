@@ -0,0 +1,128 @@
+import asyncio
+import logging
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+from telegram.request import HTTPXRequest
+from utils import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different chats concurrently while keeping
+    updates of the same chat strictly in arrival order.
+
+    The ConversationHandler state machines (TOPIC/TONE/REVIEW, AUTO_*) rely on
+    seeing a chat's updates one after another, so every chat gets its own lock.
+    A global cap limits how many updates run at once, and each chat may only
+    have a bounded number of updates waiting; anything beyond that is dropped
+    and the chat is told once.
+
+    Only the do_process_update() hook is implemented; PTB's process_update()
+    (final since v20.4) wraps it in a semaphore of `max_queued_updates`, which
+    bounds how many updates may be waiting for their chat in total. The cap on
+    running updates is this class's own, taken after the chat's lock so a chat
+    with a backlog never holds slots that other chats could use.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 8, max_pending_per_chat: int = 20,
+                 max_queued_updates: int = 256):
+        super().__init__(max(max_queued_updates, max_concurrent_updates))
+        self.max_pending_per_chat = max_pending_per_chat
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}
+        self._chat_pending = {}
+        self._chat_notified = set()
+        self.running_updates = 0
+        self.dropped_updates = 0
+
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)
+        if user is not None:
+            return f"user_{user.id}"
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            # No chat to order against (e.g. poll updates), just respect the global cap
+            async with self._running:
+                await self._run(update, key, coroutine)
+            return
+
+        pending = self._chat_pending.get(key, 0)
+        if pending >= self.max_pending_per_chat:
+            await self._drop(update, key, coroutine, pending)
+            return
+
+        self._chat_pending[key] = pending + 1
+        lock = self._chat_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                async with self._running:
+                    await self._run(update, key, coroutine)
+        finally:
+            self._chat_pending[key] -= 1
+            if self._chat_pending[key] == 0:
+                # Nobody else is queued for this chat, free the bookkeeping
+                del self._chat_pending[key]
+                self._chat_locks.pop(key, None)
+                self._chat_notified.discard(key)
+
+    async def _run(self, update, key, coroutine):
+        # Each update is one trace; handler and service spans attach to it through the context
+        self.running_updates += 1
+        try:
+            with tracing.start_trace("update", update_id=getattr(update, "update_id", None), chat=key):
+                await coroutine
+        finally:
+            self.running_updates -= 1
+
+    async def _drop(self, update, key, coroutine, pending: int):
+        self.dropped_updates += 1
+        logger.warning("Dropping update for chat %s: %s updates already pending.", key, pending)
+        if asyncio.iscoroutine(coroutine):
+            coroutine.close()
+
+        # A button press must always be answered, or the client keeps its spinner going
+        query = getattr(update, "callback_query", None)
+        if query is not None:
+            try:
+                await query.answer("⚠️ Too many requests at once, please wait.")
+            except TelegramError as e:
+                logger.warning("Failed to answer dropped callback query in chat %s: %s", key, e)
+
+        # One notice per backlog; it is reset once the chat's queue drains
+        message = getattr(update, "effective_message", None)
+        if message is None or key in self._chat_notified:
+            return
+        self._chat_notified.add(key)
+        try:
+            await message.reply_text("⚠️ Too many messages at once, some were ignored. Please wait for my replies and try again.")
+        except TelegramError as e:
+            logger.warning("Failed to notify chat %s about dropped updates: %s", key, e)
+
+    def get_stats(self) -> str:
+        # PTB's count includes the updates still waiting for their chat
+        queued = self.current_concurrent_updates - self.running_updates
+        return f"Updates: {self.running_updates} running, {queued} queued, {self.dropped_updates} dropped"
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class TracedHTTPXRequest(HTTPXRequest):
+    """Bot API requests as spans of the current update's trace, named after the method."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        endpoint = "download" if "/file/bot" in url else url.rsplit("/", 1)[-1]
+        with tracing.span(f"telegram.{endpoint}"):
+            return await super().do_request(url, method, *args, **kwargs)
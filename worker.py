@@ -0,0 +1,150 @@
+"""
+Posting worker: consumes jobs from the work queue and talks to X.
+
+The Telegram bot (main.py) only enqueues jobs; run one or more of these next
+to it. Workers and bot can be restarted independently, unfinished jobs are
+picked up again once their lease expires.
+
+Usage:
+    python worker.py [--processes 2]
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import config
+from services.work_queue import WorkQueue
+from utils import tracing
+from utils.logging_utils import setup_logging, stop_logging
+
+logger = logging.getLogger(__name__)
+
+LOG_TEXT_FORMAT = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class Worker:
+    def __init__(self, work_queue: WorkQueue = None):
+        # Imported here so each worker process sets up its own services and connections
+        from services.llm_service import LLMService
+        from services.x_service import XService
+        from services.automation_service import AutomationService
+        from services.draft_store import DraftStore
+
+        self.work_queue = work_queue or WorkQueue()
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.x_service = XService()
+        self.automation_service = AutomationService(
+            llm_service=LLMService(), x_service=self.x_service, draft_store=DraftStore(),
+            metrics_store=self.x_service.metrics_store
+        )
+        self.running = True
+
+        self.handlers = {
+            'post_tweet': self.handle_post_tweet,
+            'post_thread': self.handle_post_thread,
+            'automation_tick': self.handle_automation_tick,
+            'collect_metrics': self.handle_collect_metrics,
+        }
+
+    def handle_post_tweet(self, job):
+        payload = job['payload']
+        tweet_id = self.x_service.post_tweet(
+            payload['text'], media_paths=payload.get('media_paths'), metadata=payload.get('metadata')
+        )
+        return {'success': bool(tweet_id), 'tweet_id': tweet_id or None}
+
+    def handle_post_thread(self, job):
+        payload = job['payload']
+        segments = payload['segments']
+
+        def save_progress(posted_ids):
+            # A retry of this job resumes after the last tweet saved here
+            payload['posted_ids'] = posted_ids
+            self.work_queue.update_payload(job['id'], payload)
+
+        posted = self.x_service.post_thread(
+            segments, media_paths=payload.get('media_paths'), metadata=payload.get('metadata'),
+            posted_ids=payload.get('posted_ids'), on_progress=save_progress
+        )
+        if len(posted) < len(segments):
+            raise RuntimeError(f"Thread stopped after {len(posted)}/{len(segments)} tweets")
+        return {'success': True, 'tweet_id': posted[0], 'tweet_ids': posted}
+
+    def handle_automation_tick(self, job):
+        # Reads and updates the state shared with the bot in transactions of its own
+        self.automation_service.check_and_post()
+        return {}
+
+    def handle_collect_metrics(self, job):
+        return {'checked': self.x_service.collect_metrics()}
+
+    def stop(self, *args):
+        logger.info("Worker stopping after the current job...")
+        self.running = False
+
+    def run(self):
+        logger.info("Worker %s started.", self.worker_id)
+        while self.running:
+            job = self.work_queue.claim(self.worker_id)
+            if job is None:
+                time.sleep(config.WORKER_POLL_INTERVAL)
+                continue
+
+            handler = self.handlers.get(job['kind'])
+            if handler is None:
+                logger.error("Unknown job kind '%s' (job %s).", job['kind'], job['id'])
+                self.work_queue.fail(job['id'], f"Unknown job kind '{job['kind']}'")
+                continue
+
+            logger.info("Running %s job %s (attempt %s).", job['kind'], job['id'], job['attempts'])
+            try:
+                # Continues the trace of the update that enqueued the job, if any
+                with tracing.start_trace(f"job.{job['kind']}", parent=job['payload'].get('trace_parent'),
+                                         job_id=job['id'], attempt=job['attempts']):
+                    result = handler(job)
+            except Exception as e:
+                logger.error("Job %s failed: %s", job['id'], e)
+                self.work_queue.fail(job['id'], str(e))
+            else:
+                self.work_queue.complete(job['id'], result)
+
+
+def run_worker():
+    # Set up per process: a forked child doesn't inherit the parent's listener thread,
+    # and multiprocessing skips atexit handlers, so the queue is flushed explicitly.
+    listener = setup_logging(config.LOG_LEVEL, config.LOG_FORMAT, config.LOG_FILE,
+                             config.LOG_DEBUG_SAMPLING, text_format=LOG_TEXT_FORMAT)
+    tracing.configure_from_config()
+    try:
+        worker = Worker()
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        worker.run()
+    finally:
+        stop_logging(listener)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run posting workers.")
+    parser.add_argument("--processes", type=int, default=1, help="number of worker processes")
+    args = parser.parse_args()
+
+    if args.processes <= 1:
+        run_worker()
+    else:
+        processes = [multiprocessing.Process(target=run_worker, name=f"worker-{i}") for i in range(args.processes)]
+        for process in processes:
+            process.start()
+
+        def stop_children(*args):
+            # Each child finishes its current job before exiting
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop_children)
+        signal.signal(signal.SIGINT, stop_children)
+        for process in processes:
+            process.join()